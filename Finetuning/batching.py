@@ -0,0 +1,225 @@
+import numpy as np
+import torch
+
+# Batching for the training scripts. Instead of padding every sample to the
+# maximum length and training one sample per step, batches group samples of
+# similar length up to a token budget, and are padded only to their own
+# longest sample (TokenBudgetSampler + PadCollator). With packing
+# (PackingSampler + PackCollator), samples are instead concatenated into
+# one window per batch; position ids restart and attention stays within
+# each sample, so the loss is the one of the same samples unpacked.
+#
+# Both collators return "spans": one (row, start, end, answer_start) per
+# sample, positions in the batch tensors, for per-sample metrics. By default
+# only answer tokens are labelled: the prompt and table are context, not
+# targets, and the model only needs logits where a label is set. The
+# collators also return "label_positions", the (row, column) of every
+# position whose next token is labelled, so labelled_loss does not have to
+# find them on the device.
+
+# Batch keys that are model inputs.
+MODEL_INPUTS = ("input_ids", "attention_mask", "position_ids", "segment_ids", "labels", "label_positions")
+
+
+class TokenBudgetSampler:
+    # Batch sampler (DataLoader(batch_sampler=...)): each epoch, shuffles the
+    # samples, sorts them by length within buckets of bucket_size samples and
+    # cuts each bucket into batches whose padded size (longest sample x batch
+    # size) stays within max_tokens. The batch order is shuffled again, so
+    # lengths are not correlated with time. A sample longer than max_tokens
+    # forms a batch by itself.
+    def __init__(self, lengths, max_tokens=4096, bucket_size=1024, shuffle=True, seed=0, pad_to_multiple=8):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_tokens = max_tokens
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.pad_to_multiple = pad_to_multiple
+        self.epoch = 0
+        self._next = None
+
+    def __len__(self):
+        # Batch count of the coming epoch (it varies a little with the shuffle).
+        if self._next is None:
+            self._next = self._plan()
+        return len(self._next)
+
+    def __iter__(self):
+        batches = self._plan() if self._next is None else self._next
+        self._next = None
+        self.epoch += 1
+        return iter(batches)
+
+    def _plan(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        order = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        padded = -(-self.lengths // self.pad_to_multiple) * self.pad_to_multiple
+        batches = []
+        for start in range(0, len(order), self.bucket_size):
+            batches.extend(self._split(order[start:start + self.bucket_size], padded))
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return batches
+
+    def _split(self, bucket, padded):
+        bucket = bucket[np.argsort(padded[bucket], kind="stable")]
+        batches, batch = [], []
+        for idx in bucket.tolist():
+            # Sorted ascending, so idx is the longest sample of the batch.
+            if batch and padded[idx] * (len(batch) + 1) > self.max_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(idx)
+        if batch:
+            batches.append(batch)
+        return batches
+
+
+class PackingSampler(TokenBudgetSampler):
+    # Batch sampler for PackCollator: each batch is a set of samples whose
+    # lengths add up to at most max_tokens (the window), chosen first-fit
+    # decreasing within each bucket so windows are nearly full.
+    def __init__(self, lengths, max_tokens=4096, bucket_size=1024, shuffle=True, seed=0):
+        super().__init__(lengths, max_tokens, bucket_size, shuffle, seed, pad_to_multiple=1)
+
+    def _split(self, bucket, padded):
+        bucket = bucket[np.argsort(-padded[bucket], kind="stable")]
+        windows, room = [], []
+        for idx in bucket.tolist():
+            length = padded[idx]
+            slot = next((w for w, free in enumerate(room) if free >= length), None)
+            if slot is None:
+                windows.append([idx])
+                room.append(self.max_tokens - length)
+            else:
+                windows[slot].append(idx)
+                room[slot] -= length
+        return windows
+
+
+class PadCollator:
+    # collate_fn padding a batch of {"input_ids", "answer_start"} samples to
+    # its longest sample (rounded up to pad_to_multiple, which tensor cores
+    # prefer). Returns input_ids, attention_mask (1 on real tokens) and
+    # labels (-100 on padding, and on the prompt with answer_only, so they
+    # add nothing to the loss).
+    def __init__(self, pad_id, pad_to_multiple=8, answer_only=True):
+        self.pad_id = pad_id
+        self.pad_to_multiple = pad_to_multiple
+        self.answer_only = answer_only
+
+    def __call__(self, samples):
+        lengths = [len(sample["input_ids"]) for sample in samples]
+        width = -(-max(lengths) // self.pad_to_multiple) * self.pad_to_multiple
+        input_ids = torch.full((len(samples), width), self.pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(samples), width), dtype=torch.long)
+        for row, (sample, length) in enumerate(zip(samples, lengths)):
+            input_ids[row, :length] = sample["input_ids"]
+            attention_mask[row, :length] = 1
+        labels = input_ids.masked_fill(attention_mask == 0, -100)
+        if self.answer_only:
+            for row, sample in enumerate(samples):
+                labels[row, :sample["answer_start"]] = -100
+        return {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "labels": labels,
+            "label_positions": label_positions(labels),
+            "spans": torch.tensor([
+                [row, 0, length, sample["answer_start"]]
+                for row, (sample, length) in enumerate(zip(samples, lengths))
+            ])
+        }
+
+
+class PackCollator(PadCollator):
+    # collate_fn concatenating a PackingSampler batch into one row: position
+    # ids restart at 0 for each sample, segment_ids number the samples from
+    # 1 (0 on padding) for packed_attention_mask, and the first token of each
+    # sample gets label -100, as the model would otherwise learn to predict
+    # it from the end of the previous sample.
+    def __call__(self, samples):
+        lengths = [len(sample["input_ids"]) for sample in samples]
+        width = -(-sum(lengths) // self.pad_to_multiple) * self.pad_to_multiple
+        input_ids = torch.full((1, width), self.pad_id, dtype=torch.long)
+        position_ids = torch.zeros((1, width), dtype=torch.long)
+        segment_ids = torch.zeros((1, width), dtype=torch.long)
+        spans = []
+        start = 0
+        for segment, (sample, length) in enumerate(zip(samples, lengths), 1):
+            input_ids[0, start:start + length] = sample["input_ids"]
+            position_ids[0, start:start + length] = torch.arange(length)
+            segment_ids[0, start:start + length] = segment
+            spans.append([0, start, start + length, start + sample["answer_start"]])
+            start += length
+        labels = input_ids.masked_fill(segment_ids == 0, -100)
+        labels[0, [span[1] for span in spans]] = -100
+        if self.answer_only:
+            for _, start, _, answer_start in spans:
+                labels[0, start:answer_start] = -100
+        return {
+            "input_ids": input_ids,
+            "position_ids": position_ids,
+            "segment_ids": segment_ids,
+            "labels": labels,
+            "label_positions": label_positions(labels),
+            "spans": torch.tensor(spans)
+        }
+
+
+def label_positions(labels):
+    # (2, n) rows and columns of the positions whose next token is labelled,
+    # row-major: the positions labelled_loss computes logits for.
+    return (labels[:, 1:] != -100).nonzero().T
+
+
+def packed_attention_mask(segment_ids, dtype):
+    # Additive (batch, 1, seq, seq) attention mask for a packed batch: causal
+    # within each sample, blocked across samples. Padding (segment 0) attends
+    # causally to padding only, so no row is fully masked. LlamaForCausalLM
+    # uses a 4D mask as given (eager and sdpa attention).
+    seq = segment_ids.size(1)
+    causal = torch.ones((seq, seq), dtype=torch.bool, device=segment_ids.device).tril()
+    allowed = (segment_ids[:, :, None] == segment_ids[:, None, :]) & causal
+    mask = torch.zeros(allowed.shape, dtype=dtype, device=segment_ids.device)
+    return mask.masked_fill(~allowed, torch.finfo(dtype).min)[:, None]
+
+
+
+def labelled_loss(model, input_ids, labels, attention_mask=None, position_ids=None, segment_ids=None,
+                  label_positions=None):
+    # Mean next-token loss of a LlamaForCausalLM over the labelled tokens, and
+    # their logits. Position t predicts token t + 1, so the LM head only runs
+    # where that token is labelled: logits are (labelled tokens, vocab) in
+    # label_positions order instead of (batch, seq, vocab). The loss is the
+    # one LlamaForCausalLM computes from the full logits.
+    if segment_ids is not None:
+        # Packed batch: attention stays within each sample.
+        attention_mask = packed_attention_mask(segment_ids, model.dtype)
+    hidden = model.model(
+        input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids
+    ).last_hidden_state
+    if label_positions is None:
+        # Found on the device, which waits for the host; the collators pass
+        # them precomputed on the CPU instead.
+        label_positions = (labels[:, 1:] != -100).nonzero().T
+    rows, cols = label_positions
+    logits = model.lm_head(hidden[rows, cols])
+    loss = torch.nn.functional.cross_entropy(logits.float(), labels[rows, cols + 1], reduction="sum")
+    return loss / max(len(rows), 1), logits
+
+
+def answer_targets(batch):
+    # For the logits of labelled_loss on a collated batch: the index of the
+    # logit of each answer token, the token it should predict, and the answer
+    # tokens per sample, in span order. Other labelled positions (the whole
+    # sample with answer_only=False) are left out. Computed on the CPU.
+    rows, cols = batch["label_positions"]
+    cols = cols + 1
+    owner = torch.full(batch["labels"].shape, -1, dtype=torch.long)
+    for sample, (row, _, end, answer) in enumerate(batch["spans"].tolist()):
+        owner[row, answer:end] = sample
+    owner = owner[rows, cols]
+    index = (owner >= 0).nonzero().squeeze(1)
+    counts = torch.bincount(owner[index], minlength=len(batch["spans"]))
+    return index, batch["labels"][rows[index], cols[index]], counts
@@ -4,6 +4,7 @@ import os
 from tqdm import tqdm
 import Levenshtein
 from transformers import AutoTokenizer, LlamaForCausalLM
+from tables import table_text
 
 # === Device Setup ===
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -68,7 +69,7 @@ def main():
     for idx, entry in enumerate(tqdm(test_data)):
         question = entry["question"]
         ground_truth = entry["answer_text"].strip().lower()
-        table_html = entry["otsl"]
+        table_html = table_text(entry, "otsl")
 
         input_text = f"""### Instruction:
         Given the following table, answer the question in one word or short phrase. Do not provide an explanation.
@@ -1,62 +1,52 @@
 import os
-import json
+import argparse
 import torch
 import torch.nn as nn
 from torch.utils.data import Dataset, DataLoader
 from transformers import AutoTokenizer, LlamaForCausalLM
 from tqdm import tqdm
-import Levenshtein
+from token_cache import load_token_cache
+from train_metrics import AnswerMetrics
+from batching import (
+    TokenBudgetSampler, PackingSampler, PadCollator, PackCollator, MODEL_INPUTS, labelled_loss
+)
 
 # === Device Setup ===
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 print(f"Using device: {device}")
 
-# === Dataset Class using HTML format ===
-class TableVQADataset(Dataset):
-    def __init__(self, json_path, tokenizer, max_seq_len=4096):
-        print(f"Loading dataset from {json_path}")
-        with open(json_path, 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
-        print(f"Loaded {len(self.data)} samples.")
-        self.tokenizer = tokenizer
-        self.max_seq_len = max_seq_len
-
-    def __len__(self):
-        return len(self.data)
-
-    def __getitem__(self, idx):
-        entry = self.data[idx]
-        question = entry["question"]
-        answer = entry["answer_text"]
-        table_context = entry["html"]  # Use HTML instead of OTSL
-
-        input_text = f"""### Instruction:
+# Prompt of every sample; the answer follows after a space.
+PROMPT = """### Instruction:
         Given the following HTML table, answer the question in one word or short phrase. Do not provide an explanation.
 
         ### Table:
-        {table_context}
+        {table}
 
         ### Question:
         {question}
 
         ### Answer:"""
 
-        full_text = input_text + " " + answer
-
-        encoded = self.tokenizer(
-            full_text,
-            truncation=True,
-            padding='max_length',
-            max_length=self.max_seq_len,
-            return_tensors='pt'
-        )
+# === Dataset Class using HTML format ===
+class TableVQADataset(Dataset):
+    def __init__(self, json_path, tokenizer, max_seq_len=4096, cache_dir="token_cache"):
+        # Samples are tokenized once into a memory-mapped cache (see
+        # token_cache.py) and read back as zero-copy slices.
+        print(f"Loading dataset from {json_path}")
+        self.cache = load_token_cache(cache_dir, json_path, tokenizer, PROMPT, "html", max_seq_len)
+        print(f"Loaded {len(self.cache)} samples.")
+        self.tokenizer = tokenizer
+        self.max_seq_len = max_seq_len
 
-        input_ids = encoded.input_ids.squeeze(0)
-        labels = input_ids.clone()
+    def __len__(self):
+        return len(self.cache)
 
+    def __getitem__(self, idx):
+        input_ids, answer_start = self.cache[idx]
+        # A view into the cache; PadCollator pads and labels the batch.
         return {
-            "input_ids": input_ids,
-            "labels": labels
+            "input_ids": torch.from_numpy(input_ids),
+            "answer_start": answer_start
         }
 
 # === Model Wrapper ===
@@ -71,51 +61,36 @@ class TableVQAModel(nn.Module):
         ).to(device)
         self.model.gradient_checkpointing_enable()
 
-    def forward(self, input_ids, labels):
-        outputs = self.model(input_ids=input_ids, labels=labels)
-        return outputs.loss, outputs.logits
+    def forward(self, input_ids, labels, attention_mask=None, position_ids=None, segment_ids=None,
+                label_positions=None):
+        # (mean loss, logits of the labelled tokens): batching.labelled_loss.
+        return labelled_loss(
+            self.model, input_ids, labels, attention_mask, position_ids, segment_ids, label_positions
+        )
 
 # === Training Function ===
-def train(model, dataloader, tokenizer, epochs=6):
+def train(model, dataloader, tokenizer, epochs=6, log_every=10):
     model.train()
+    metrics = AnswerMetrics(tokenizer)
     for epoch in range(epochs):
         print(f"\nEpoch {epoch+1}/{epochs}")
-        total_loss = 0
-        exact_match = 0
-        similar_match = 0
-        total = 0
+        metrics.reset()
 
         for i, batch in enumerate(tqdm(dataloader)):
-            input_ids = batch["input_ids"].to(device)
-            labels = batch["labels"].to(device)
+            inputs = {key: batch[key].to(device, non_blocking=True) for key in MODEL_INPUTS if key in batch}
 
             optimizer.zero_grad()
-            loss, logits = model(input_ids=input_ids, labels=labels)
+            loss, logits = model(**inputs)
             loss.backward()
             optimizer.step()
 
-            total_loss += loss.item()
-
-            for j in range(input_ids.size(0)):
-                output_ids = torch.argmax(logits[j], dim=-1)
-                pred = tokenizer.decode(output_ids, skip_special_tokens=True)
-                label = tokenizer.decode(labels[j], skip_special_tokens=True)
-
-                pred = pred.strip().lower().split("### answer:")[-1].strip()
-                label = label.strip().lower().split("### answer:")[-1].strip()
-
-                if pred == label:
-                    exact_match += 1
-                if Levenshtein.ratio(pred, label) >= 0.8:
-                    similar_match += 1
-                total += 1
-
-            if i % 10 == 0:
+            # On-device answer metrics; host sync and decoding every log_every steps.
+            metrics.update(loss, logits, batch)
+            if i % log_every == 0:
+                metrics.flush()
                 print(f"Batch {i}, Loss: {loss.item():.4f}")
 
-        avg_loss = total_loss / len(dataloader)
-        exact_acc = exact_match / total * 100
-        sim_acc = similar_match / total * 100
+        avg_loss, exact_acc, sim_acc = metrics.summary()
 
         print(f"\nEpoch {epoch+1} Results:")
         print(f"Average Loss: {avg_loss:.4f}")
@@ -127,7 +102,7 @@ def train(model, dataloader, tokenizer, epochs=6):
         print(f"Model checkpoint saved: llama8bhtmlresults/tablevqa_epoch{epoch+1}.pth")
 
 # === Main Function ===
-def main():
+def main(pack=False, max_tokens=4096, log_every=10):
     json_path = "src/model/combined_wtq_html_otsl_sequential.json"
     model_name = "meta-llama/Meta-Llama-3-8B-Instruct"
 
@@ -135,22 +110,31 @@ def main():
     tokenizer.pad_token = tokenizer.eos_token
 
     dataset = TableVQADataset(json_path, tokenizer, max_seq_len=4096)
-    dataloader = DataLoader(dataset, batch_size=1, shuffle=True)
+    if pack:
+        # Samples concatenated into windows of max_tokens tokens.
+        collate = PackCollator(tokenizer.pad_token_id)
+        sampler = PackingSampler(dataset.cache.lengths, max_tokens=max_tokens)
+    else:
+        # Batches of similar-length samples, padded to their longest one, with at
+        # most max_tokens padded tokens each (one 4096-token sample used to fill it).
+        collate = PadCollator(tokenizer.pad_token_id)
+        sampler = TokenBudgetSampler(dataset.cache.lengths, max_tokens=max_tokens)
+    dataloader = DataLoader(dataset, batch_sampler=sampler, collate_fn=collate, pin_memory=True)
 
     model = TableVQAModel(model_name)
     global optimizer
     optimizer = torch.optim.AdamW(model.parameters(), lr=2e-5)
 
-    train(model, dataloader, tokenizer, epochs=4)
+    train(model, dataloader, tokenizer, epochs=4, log_every=log_every)
 
     # === Sample Inference on 10 Examples ===
     model.eval()
     print("\nSample Predictions after Training:")
     count = 0
     with torch.no_grad():
-        for batch in dataloader:
+        # One unpadded sample at a time for generate().
+        for batch in DataLoader(dataset, batch_size=1, shuffle=True, collate_fn=PadCollator(tokenizer.pad_token_id, 1)):
             input_ids = batch["input_ids"].to(device)
-            labels = batch["labels"].to(device)
 
             outputs = model.model.generate(
                 input_ids=input_ids,
@@ -163,7 +147,7 @@ def main():
 
             for i in range(input_ids.size(0)):
                 input_text = tokenizer.decode(input_ids[i], skip_special_tokens=True)
-                label = tokenizer.decode(labels[i], skip_special_tokens=True)
+                label = tokenizer.decode(input_ids[i], skip_special_tokens=True)
                 pred = tokenizer.decode(outputs[i], skip_special_tokens=True)
 
                 question = input_text.split("### Question:")[-1].split("### Answer:")[0].strip()
@@ -182,7 +166,12 @@ def main():
                 break
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pack", action="store_true", help="Pack several samples into each max_tokens window")
+    parser.add_argument("--max_tokens", type=int, default=4096, help="Tokens per batch, padding included (window size with --pack)")
+    parser.add_argument("--log_every", type=int, default=10, help="Steps between loss prints and metric syncs")
+    args = parser.parse_args()
+    main(pack=args.pack, max_tokens=args.max_tokens, log_every=args.log_every)
 
 
 
@@ -5,6 +5,7 @@ import re
 from tqdm import tqdm
 import Levenshtein
 from transformers import AutoTokenizer, LlamaForCausalLM
+from tables import table_text
 
 # === Device Setup ===
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -83,7 +84,7 @@ def main():
     for idx, entry in enumerate(tqdm(test_data)):
         question = entry["question"]
         ground_truth = entry["gt"].strip().lower()
-        table_html = entry["otsl"]
+        table_html = table_text(entry, "otsl")
 
         input_text = f"""### Instruction:
         Given the following table, answer the question in one word or short phrase. Do not provide an explanation.
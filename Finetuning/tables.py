@@ -0,0 +1,12 @@
+# table_text for the training and accuracy scripts. With the repository root
+# on the path, table_codec converts an entry that only stores another table
+# format; without it, each entry is read from the field of the selected
+# format.
+try:
+    from table_codec import table_text
+except ImportError:
+    def table_text(entry, fmt, fields=None):
+        key = (fields or {}).get(fmt, fmt)
+        if entry.get(key) is None:
+            raise KeyError(f"Entry has no {key} field")
+        return entry[key]
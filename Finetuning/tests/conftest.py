@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The training modules are flat and import each other by name, as when run
+# from Finetuning.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
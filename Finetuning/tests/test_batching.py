@@ -0,0 +1,115 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from batching import (
+    MODEL_INPUTS, PackCollator, PackingSampler, PadCollator, answer_targets, labelled_loss, packed_attention_mask
+)
+
+# Packing must not change what the model learns: on a tiny random-init
+# Llama (CPU), the same samples padded and packed give the same loss and
+# gradients. labelled_loss, which only computes the logits of labelled
+# positions, must give the loss of the full logits.
+N_SAMPLES, MAX_TOKENS = 12, 256
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=128, hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=MAX_TOKENS
+    )
+    return transformers.LlamaForCausalLM(config).float()
+
+
+@pytest.fixture(scope="module")
+def samples(model):
+    generator = torch.Generator().manual_seed(0)
+    lengths = torch.randint(8, MAX_TOKENS // N_SAMPLES, (N_SAMPLES,), generator=generator).tolist()
+    return [
+        {"input_ids": torch.randint(1, model.config.vocab_size, (length,), generator=generator), "answer_start": length // 2}
+        for length in lengths
+    ]
+
+
+def full_loss(model, input_ids, labels, attention_mask=None, position_ids=None, segment_ids=None,
+              label_positions=None):
+    # LlamaForCausalLM's own loss, from the full logits.
+    if segment_ids is not None:
+        attention_mask = packed_attention_mask(segment_ids, model.dtype)
+    return model(input_ids=input_ids, labels=labels, attention_mask=attention_mask, position_ids=position_ids).loss
+
+
+def loss_and_grads(model, loss_fn, batch):
+    model.zero_grad()
+    loss = loss_fn(model, **{key: batch[key] for key in MODEL_INPUTS if key in batch})
+    loss.backward()
+    return loss.item(), [p.grad.clone() for p in model.parameters()]
+
+
+def assert_close(x, y, tolerance=1e-5):
+    assert abs(x[0] - y[0]) <= tolerance
+    assert max((a - b).abs().max().item() for a, b in zip(x[1], y[1])) <= tolerance
+
+
+def test_samples_fit_one_window(samples):
+    lengths = [len(sample["input_ids"]) for sample in samples]
+    assert len(list(PackingSampler(lengths, MAX_TOKENS, shuffle=False))) == 1
+
+
+def test_pack_collator_layout(samples):
+    batch = PackCollator(0)(samples)
+    for segment, (_, start, end, _) in enumerate(batch["spans"].tolist(), 1):
+        assert batch["position_ids"][0, start:end].tolist() == list(range(end - start))
+        assert (batch["segment_ids"][0, start:end] == segment).all()
+        assert batch["labels"][0, start] == -100
+    assert (batch["labels"][batch["segment_ids"] == 0] == -100).all()
+
+
+def test_packed_attention_mask():
+    allowed = packed_attention_mask(torch.tensor([[1, 1, 2, 2, 2, 0]]), torch.float32)[0, 0] == 0
+    expected = torch.tensor([
+        [1, 0, 0, 0, 0, 0],
+        [1, 1, 0, 0, 0, 0],
+        [0, 0, 1, 0, 0, 0],
+        [0, 0, 1, 1, 0, 0],
+        [0, 0, 1, 1, 1, 0],
+        [0, 0, 0, 0, 0, 1],
+    ], dtype=torch.bool)
+    assert torch.equal(allowed, expected)
+
+
+def labelled(model, **inputs):
+    return labelled_loss(model, **inputs)[0]
+
+
+@pytest.mark.parametrize("answer_only", [True, False])
+def test_packed_matches_padded(model, samples, answer_only):
+    padded = loss_and_grads(model, labelled, PadCollator(0, answer_only=answer_only)(samples))
+    packed = loss_and_grads(model, labelled, PackCollator(0, answer_only=answer_only)(samples))
+    assert_close(padded, packed)
+
+
+@pytest.mark.parametrize("answer_only", [True, False])
+@pytest.mark.parametrize("collator", [PadCollator, PackCollator])
+def test_labelled_loss_matches_full_logits(model, samples, collator, answer_only):
+    batch = collator(0, answer_only=answer_only)(samples)
+    assert_close(loss_and_grads(model, labelled, batch), loss_and_grads(model, full_loss, batch))
+    # Without precomputed positions they are found on the device.
+    batch.pop("label_positions")
+    assert_close(loss_and_grads(model, labelled, batch), loss_and_grads(model, full_loss, batch))
+
+
+@pytest.mark.parametrize("answer_only", [True, False])
+@pytest.mark.parametrize("collator", [PadCollator, PackCollator])
+def test_answer_targets(samples, collator, answer_only):
+    batch = collator(0, answer_only=answer_only)(samples)
+    index, targets, counts = answer_targets(batch)
+    rows, cols = batch["label_positions"]
+    expected = [batch["input_ids"][row, answer:end] for row, _, end, answer in batch["spans"].tolist()]
+    assert counts.tolist() == [len(ids) for ids in expected]
+    assert torch.equal(targets, torch.cat(expected))
+    # Each logit index points at the position predicting that token.
+    assert torch.equal(batch["input_ids"][rows[index], cols[index] + 1], targets)
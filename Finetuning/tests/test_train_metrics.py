@@ -0,0 +1,51 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("Levenshtein")
+
+from batching import PackCollator, PadCollator
+from train_metrics import AnswerMetrics
+
+# AnswerMetrics must score each sample's answer whether the logits cover the
+# answers only or every labelled position (answer_only=False).
+VOCAB = 32
+
+
+class Tokenizer:
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return [" ".join(map(str, ids)) for ids in sequences]
+
+
+def make_samples():
+    generator = torch.Generator().manual_seed(0)
+    lengths = [9, 14, 6, 11, 8]
+    return [
+        {"input_ids": torch.randint(1, VOCAB, (length,), generator=generator), "answer_start": length - 3}
+        for length in lengths
+    ]
+
+
+def logits_predicting(batch, wrong_sample):
+    # One-hot logits of the labelled positions that predict every target
+    # token, except the last answer token of wrong_sample.
+    rows, cols = batch["label_positions"]
+    targets = batch["labels"][rows, cols + 1].clone()
+    _, _, end, _ = batch["spans"][wrong_sample].tolist()
+    row = batch["spans"][wrong_sample, 0]
+    last = ((rows == row) & (cols + 1 == end - 1)).nonzero().item()
+    targets[last] = (targets[last] + 1) % VOCAB
+    return torch.nn.functional.one_hot(targets, VOCAB).float()
+
+
+@pytest.mark.parametrize("collator", [PadCollator, PackCollator])
+@pytest.mark.parametrize("answer_only", [True, False])
+def test_answer_metrics(collator, answer_only):
+    samples = make_samples()
+    batch = collator(0, answer_only=answer_only)(samples)
+    metrics = AnswerMetrics(Tokenizer(), threshold=1.0)
+    for step in range(2):
+        metrics.update(torch.tensor(float(step + 1)), logits_predicting(batch, wrong_sample=step), batch)
+    loss, exact, similar = metrics.summary()
+    assert metrics.samples == 2 * len(samples)
+    assert loss == 1.5
+    assert exact == similar == (2 * len(samples) - 2) / (2 * len(samples)) * 100
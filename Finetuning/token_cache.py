@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from tqdm import tqdm
+from tables import table_text
+
+# One-time tokenization of a TableVQA JSON file for the training scripts.
+# Every sample (prompt + " " + answer) is tokenized once and the ids of all
+# samples are stored back to back in one flat array:
+#   tokens.npy         int32 token ids of all samples
+#   offsets.npy        int64, sample i is tokens[offsets[i]:offsets[i + 1]]
+#   lengths.npy        int32 tokens per sample
+#   answer_starts.npy  int32 index of the first answer token within sample i
+#                      (== its length when truncation cut the answer off)
+#   meta.json          what the cache was built from; written last
+# Arrays are opened memory-mapped, so a dataset holds neither the JSON nor
+# the ids in memory, and reading a sample is a slice of the map (no copy).
+# Each (JSON file, tokenizer, prompt, format, max length) gets its own
+# subdirectory of cache_dir; editing any of them builds a new cache.
+CACHE_VERSION = 1
+_ARRAYS = ("tokens", "offsets", "lengths", "answer_starts")
+
+
+class TokenCache:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        # Copy-on-write maps: writable views (torch.from_numpy accepts them)
+        # that never write back to the files.
+        self.arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="c") for name in _ARRAYS}
+        self.tokens = self.arrays["tokens"]
+        self.offsets = self.arrays["offsets"]
+        self.lengths = self.arrays["lengths"]
+        self.answer_starts = self.arrays["answer_starts"]
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, idx):
+        # (token ids as a view into the map, index of the first answer token)
+        return self.tokens[self.offsets[idx]:self.offsets[idx + 1]], int(self.answer_starts[idx])
+
+
+def cache_meta(json_path, tokenizer, template, fmt, max_seq_len):
+    stat = os.stat(json_path)
+    return {
+        "version": CACHE_VERSION,
+        "json_path": os.path.abspath(json_path),
+        "json_size": stat.st_size,
+        "json_mtime_ns": stat.st_mtime_ns,
+        "tokenizer": tokenizer.name_or_path,
+        "vocab_size": len(tokenizer),
+        "template": hashlib.sha1(template.encode("utf-8")).hexdigest(),
+        "format": fmt,
+        "max_seq_len": max_seq_len
+    }
+
+
+def load_token_cache(cache_dir, json_path, tokenizer, template, fmt, max_seq_len):
+    # The TokenCache of json_path, built first if it is missing or stale.
+    # template is the prompt with {table} and {question} placeholders; fmt
+    # the table format read through tables.table_text.
+    meta = cache_meta(json_path, tokenizer, template, fmt, max_seq_len)
+    key = hashlib.sha1(json.dumps(meta, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(path, "meta.json")):
+        print(f"[INFO] Using token cache: {path}")
+    else:
+        build_token_cache(path, json_path, tokenizer, template, fmt, max_seq_len, meta)
+    return TokenCache(path)
+
+
+def build_token_cache(path, json_path, tokenizer, template, fmt, max_seq_len, meta, batch_size=1000):
+    print(f"[INFO] Tokenizing {json_path} into {path}")
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    prompts = [template.format(table=table_text(entry, fmt), question=entry["question"]) for entry in data]
+    texts = [prompt + " " + entry["answer_text"] for prompt, entry in zip(prompts, data)]
+    del data
+
+    parts, lengths, answer_starts = [], [], []
+    for start in tqdm(range(0, len(texts), batch_size), desc="Tokenizing"):
+        encoded = tokenizer(
+            texts[start:start + batch_size],
+            truncation=True,
+            max_length=max_seq_len,
+            return_offsets_mapping=True
+        )
+        for ids, spans, prompt in zip(encoded["input_ids"], encoded["offset_mapping"], prompts[start:start + batch_size]):
+            parts.append(np.asarray(ids, dtype=np.int32))
+            lengths.append(len(ids))
+            # Answer tokens start at the " " after the prompt; special tokens
+            # (BOS) have empty spans at 0 and count as prompt.
+            answer_starts.append(sum(1 for begin, _ in spans if begin < len(prompt)))
+
+    lengths = np.asarray(lengths, dtype=np.int32)
+    arrays = {
+        "tokens": np.concatenate(parts) if parts else np.empty(0, np.int32),
+        "offsets": np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+        "lengths": lengths,
+        "answer_starts": np.asarray(answer_starts, dtype=np.int32)
+    }
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        tmp_path = os.path.join(path, f"{name}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+    meta = dict(meta, samples=len(lengths), tokens=int(lengths.sum()))
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"[INFO] Saved {len(lengths)} samples ({int(lengths.sum())} tokens) to: {path}")
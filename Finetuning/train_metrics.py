@@ -0,0 +1,81 @@
+import Levenshtein
+import torch
+from batching import answer_targets
+
+# Answer accuracy during training (teacher forcing), kept off the critical
+# path. update() only queues tensor ops on the model's device: the argmax of
+# the answer logits (batching.answer_targets picks them out of those of all
+# labelled positions), compared token by token with the answer ids, gives each
+# sample's exact match, and the loss is summed on the device. Nothing is
+# copied to the host until flush(), which the training loop calls every
+# log_every steps: it reads the sums and decodes the queued answer spans
+# (a few tokens each) in one batch for the Levenshtein ratio.
+
+
+class AnswerMetrics:
+    def __init__(self, tokenizer, threshold=0.8):
+        self.tokenizer = tokenizer
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.samples = 0
+        self.loss = 0.0
+        self.exact = 0
+        self.similar = 0
+        self._loss = None
+        self._exact = None
+        self._pending = []
+
+    def update(self, loss, logits, batch):
+        # loss, logits: from TableVQAModel (logits cover the labelled
+        # positions, row by row); batch: the collator's output, on the CPU.
+        device = logits.device
+        # Built on the CPU from the batch: no sync.
+        index, targets, counts = answer_targets(batch)
+        spans = batch["spans"]
+        # The answers come in span order (row-major, like the spans).
+        sample = torch.repeat_interleave(torch.arange(len(spans)), counts)
+
+        targets = targets.to(device, non_blocking=True)
+        predicted = logits.detach()[index.to(device, non_blocking=True)].argmax(dim=-1)
+        wrong = torch.zeros(len(spans), dtype=torch.long, device=device)
+        wrong.index_add_(0, sample.to(device, non_blocking=True), (predicted != targets).long())
+        # A sample whose answer was truncated away has nothing to match.
+        exact = ((wrong == 0) & (counts > 0).to(device, non_blocking=True)).sum()
+        self._exact = exact if self._exact is None else self._exact + exact
+        self._loss = loss.detach() if self._loss is None else self._loss + loss.detach()
+        self._pending.append((predicted, targets, counts.tolist()))
+        self.steps += 1
+        self.samples += len(spans)
+
+    def flush(self):
+        # Host sync: folds the device sums in and scores the queued answers.
+        if not self._pending:
+            return
+        self.loss += self._loss.item()
+        self.exact += int(self._exact.item())
+        self._loss = self._exact = None
+
+        predicted = torch.cat([p for p, _, _ in self._pending]).tolist()
+        targets = torch.cat([t for _, t, _ in self._pending]).tolist()
+        counts = [count for _, _, step_counts in self._pending for count in step_counts]
+        self._pending = []
+        preds, labels, start = [], [], 0
+        for count in counts:
+            preds.append(predicted[start:start + count])
+            labels.append(targets[start:start + count])
+            start += count
+        preds = self.tokenizer.batch_decode(preds, skip_special_tokens=True)
+        labels = self.tokenizer.batch_decode(labels, skip_special_tokens=True)
+        self.similar += sum(
+            Levenshtein.ratio(pred.strip().lower(), label.strip().lower()) >= self.threshold
+            for pred, label in zip(preds, labels)
+        )
+
+    def summary(self):
+        # (average loss per step, exact match %, Levenshtein >= threshold %)
+        self.flush()
+        samples = max(self.samples, 1)
+        return self.loss / max(self.steps, 1), self.exact / samples * 100, self.similar / samples * 100
@@ -0,0 +1,293 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy as np
+from bs4 import BeautifulSoup
+from metric import TEDS, clear_structure_memo
+from otsl import otsl_to_html, otsl_to_tree
+from utils import preprocess, clean_html, html_to_tree
+
+WORDS = ["12", "3.4", "Total", "net income", "(5)", "2019", "&nbsp;", "n/a"]
+LETTERS = "abcdefghijklmnopqrstuvwxyz0123456789 "
+
+# Settings a --compare baseline must share with the current run (sizes are
+# matched row by row).
+CONFIG_FIELDS = ["cols", "num_tables", "span_density", "text_len", "perturb", "seed", "content_cost", "kernel"]
+
+def synthetic_table(rng, rows, cols):
+    cells = []
+    for r in range(rows):
+        tag = "th" if r == 0 else "td"
+        row = "".join(
+            f'<{tag} style="x" colspan="{rng.randint(1, 2)}"> <p>{rng.choice(WORDS)}</p> </{tag}>'
+            for _ in range(cols)
+        )
+        cells.append(f'<tr class="r{r}">{row}</tr>')
+    return f'<table border="1"><thead>{cells[0]}</thead><tbody>{"".join(cells[1:])}</tbody></table>'
+
+def random_text(rng, text_len):
+    return "".join(rng.choice(LETTERS) for _ in range(rng.randint(1, max(1, text_len))))
+
+def synthetic_grid(rng, rows, cols, span_density, text_len):
+    # Rows of [colspan, text] cells; each cell starts a span with
+    # probability span_density.
+    grid = []
+    for _ in range(rows):
+        row = []
+        col = 0
+        while col < cols:
+            span = rng.randint(2, 3) if rng.random() < span_density else 1
+            span = min(span, cols - col)
+            row.append([span, random_text(rng, text_len)])
+            col += span
+        grid.append(row)
+    return grid
+
+def perturb_grid(rng, grid, perturb, text_len):
+    # Each cell is, with probability perturb, given new text, dropped or
+    # split into single cells; each row is dropped, or duplicated, with
+    # probability perturb / 8.
+    out = []
+    for row in grid:
+        roll = rng.random()
+        if roll < perturb / 8:
+            continue
+        new_row = []
+        for span, text in row:
+            if rng.random() >= perturb:
+                new_row.append([span, text])
+                continue
+            edit = rng.randrange(3)
+            if edit == 0:
+                new_row.append([span, random_text(rng, text_len)])
+            elif edit == 2:
+                new_row.extend([[1, text]] * span)
+        out.append(new_row)
+        if roll > 1 - perturb / 8:
+            out.append(list(new_row))
+    return out
+
+def grid_to_html(grid):
+    rows = []
+    for r, row in enumerate(grid):
+        tag = "th" if r == 0 else "td"
+        cells = "".join(
+            f'<{tag} colspan="{span}">{text}</{tag}>' if span > 1 else f"<{tag}>{text}</{tag}>"
+            for span, text in row
+        )
+        rows.append(f"<tr>{cells}</tr>")
+    head, body = "".join(rows[:1]), "".join(rows[1:])
+    return f'<table border="1"><thead>{head}</thead><tbody>{body}</tbody></table>'
+
+def grid_to_otsl(grid):
+    return "".join(
+        "".join(("<fcel>" + text if text else "<ecel>") + "<lcel>" * (span - 1) for span, text in row) + "<nl>"
+        for row in grid
+    )
+
+def synthetic_pair(rng, rows, cols, span_density=0.1, text_len=8, perturb=0.1):
+    # (pred_html, gt_html) where the prediction is a perturbed copy of the GT.
+    grid = synthetic_grid(rng, rows, cols, span_density, text_len)
+    return grid_to_html(perturb_grid(rng, grid, perturb, text_len)), grid_to_html(grid)
+
+def legacy_normalize(pred, gt):
+    # preprocess/clean_html followed by the BeautifulSoup reparse in _html2tree
+    pred_soup = BeautifulSoup(preprocess(pred), "lxml").find("table")
+    gt_soup = BeautifulSoup(f"<html>{clean_html(gt)}</html>", "lxml").find("table")
+    return pred_soup, gt_soup
+
+def onepass_normalize(pred, gt):
+    pred_tree = html_to_tree(pred, structure_only=False, clean=True, strip_attributes=True)
+    gt_tree = html_to_tree(gt, structure_only=False, clean=True)
+    return pred_tree, gt_tree
+
+def otsl_trees_via_html(pred, gt):
+    pred_tree = html_to_tree(otsl_to_html(pred), clean=True, strip_attributes=True)
+    return pred_tree, html_to_tree(otsl_to_html(gt), clean=True)
+
+def otsl_trees(pred, gt):
+    return otsl_to_tree(pred), otsl_to_tree(gt)
+
+def otsl_via_html(teds, pred, gt):
+    # OTSL outputs scored the HTML way: converted, then parsed by lxml.
+    return teds.evaluate(otsl_to_html(pred), otsl_to_html(gt), raw=True)
+
+def time_normalizer(fn, pairs, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        clear_structure_memo()
+        start = time.perf_counter()
+        for pred, gt in pairs:
+            fn(pred, gt)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def time_stages(pairs, repeat, content_cost="exact", kernel="scalar"):
+    # Seconds spent per stage over all pairs (best of repeat for each stage):
+    # html2tree is the whole of TEDS._html2tree, of which parse/normalize
+    # are the lxml parse and the tree building; distance is the TEDS and TED
+    # edit distances on the built trees, pair by pair or through the
+    # batched kernel.
+    teds = TEDS(content_cost=content_cost, kernel=kernel)
+    best = None
+    nodes = 0
+    for _ in range(repeat):
+        times = {"html2tree": 0.0, "parse": 0.0, "normalize": 0.0, "distance": 0.0}
+        # Every repetition measures the DP, not the memo filled by the last.
+        clear_structure_memo()
+        trees = []
+        for pred, gt in pairs:
+            start = time.perf_counter()
+            pred_tree = teds._html2tree(pred, False, clean=True, strip_attributes=True, timings=times)
+            gt_tree = teds._html2tree(gt, False, clean=True, timings=times)
+            times["html2tree"] += time.perf_counter() - start
+            trees.append((pred_tree, gt_tree))
+        nodes = sum(len(pred_tree) + len(gt_tree) for pred_tree, gt_tree in trees)
+
+        start = time.perf_counter()
+        if kernel == "batched":
+            teds._evaluate_chunk("evaluate_both", [(pred_tree, gt_tree, False, False) for pred_tree, gt_tree in trees])
+        else:
+            for pred_tree, gt_tree in trees:
+                teds._similarity(pred_tree, gt_tree)
+                teds._similarity(pred_tree.content(), gt_tree.content(), content=True)
+        times["distance"] += time.perf_counter() - start
+        best = times if best is None else {stage: min(best[stage], times[stage]) for stage in best}
+    return nodes, best
+
+def run_suite(args):
+    results = []
+    print(f" {'rows':>5} {'nodes/pair':>10} {'html2tree':>10} {'parse':>8} {'normalize':>10} "
+          f"{'distance':>9} {'nodes/s':>10}")
+    for rows in args.sizes:
+        # Seeded per size so adding a size leaves the others' tables unchanged.
+        rng = random.Random(f"{args.seed}-{rows}")
+        pairs = [
+            synthetic_pair(rng, rows, args.cols, args.span_density, args.text_len, args.perturb)
+            for _ in range(args.num_tables)
+        ]
+        nodes, times = time_stages(pairs, args.repeat, args.content_cost, args.kernel)
+        total = times["html2tree"] + times["distance"]
+        result = {
+            "rows": rows,
+            "nodes_per_pair": nodes / len(pairs),
+            "seconds_per_pair": total / len(pairs),
+            "nodes_per_sec": nodes / total,
+            **times
+        }
+        results.append(result)
+        print(f" {rows:5d} {result['nodes_per_pair']:10.1f} {times['html2tree']:10.3f} {times['parse']:8.3f} "
+              f"{times['normalize']:10.3f} {times['distance']:9.3f} {result['nodes_per_sec']:10.0f}")
+
+    if len(results) > 1:
+        # Slope of log(time per pair) against log(nodes per pair).
+        slope = np.polyfit(
+            np.log([r["nodes_per_pair"] for r in results]),
+            np.log([r["seconds_per_pair"] for r in results]), 1
+        )[0]
+        print(f"\n Scaling: time per pair ~ nodes^{slope:.2f}")
+    return results
+
+def compare(results, baseline, tolerance):
+    # Returns the sizes whose throughput fell more than tolerance below the baseline.
+    previous = {r["rows"]: r for r in baseline["results"]}
+    regressions = []
+    print(f"\n {'rows':>5} {'baseline nodes/s':>17} {'nodes/s':>10} {'change':>8}")
+    for result in results:
+        old = previous.get(result["rows"])
+        if old is None:
+            continue
+        change = result["nodes_per_sec"] / old["nodes_per_sec"] - 1
+        print(f" {result['rows']:5d} {old['nodes_per_sec']:17.0f} {result['nodes_per_sec']:10.0f} {change:+8.1%}")
+        if change < -tolerance:
+            regressions.append(result["rows"])
+    return regressions
+
+def main(args):
+    if args.normalizers:
+        rng = random.Random(args.seed)
+        pairs = [
+            (synthetic_table(rng, args.rows, args.cols), synthetic_table(rng, args.rows, args.cols))
+            for _ in range(args.num_tables)
+        ]
+        legacy = time_normalizer(legacy_normalize, pairs, args.repeat)
+        onepass = time_normalizer(onepass_normalize, pairs, args.repeat)
+
+        print(f"[INFO] {args.num_tables} table pairs, {args.rows}x{args.cols} cells")
+        print(f" Legacy preprocess + BeautifulSoup: {legacy:.3f}s")
+        print(f" One-pass lxml normalizer:          {onepass:.3f}s")
+        print(f" Speedup:                           {legacy / onepass:.1f}x")
+        return
+
+    if args.otsl:
+        rng = random.Random(args.seed)
+        pairs = []
+        for _ in range(args.num_tables):
+            grid = synthetic_grid(rng, args.rows, args.cols, args.span_density, args.text_len)
+            pairs.append((grid_to_otsl(perturb_grid(rng, grid, args.perturb, args.text_len)), grid_to_otsl(grid)))
+        html_teds, otsl_teds = TEDS(), TEDS(pred_format="otsl", gt_format="otsl")
+        timings = {
+            "parse via HTML": time_normalizer(otsl_trees_via_html, pairs, args.repeat),
+            "parse OTSL": time_normalizer(otsl_trees, pairs, args.repeat),
+            "TEDS via HTML": time_normalizer(lambda pred, gt: otsl_via_html(html_teds, pred, gt), pairs, args.repeat),
+            "TEDS on OTSL": time_normalizer(otsl_teds.evaluate, pairs, args.repeat),
+        }
+        mismatches = sum(otsl_via_html(html_teds, pred, gt) != otsl_teds.evaluate(pred, gt) for pred, gt in pairs)
+
+        print(f"[INFO] {args.num_tables} OTSL table pairs, {args.rows}x{args.cols} cells")
+        for name, seconds in timings.items():
+            print(f" {name + ':':<16} {seconds:.3f}s")
+        print(f" Parse speedup:   {timings['parse via HTML'] / timings['parse OTSL']:.1f}x")
+        print(f" TEDS speedup:    {timings['TEDS via HTML'] / timings['TEDS on OTSL']:.1f}x")
+        if mismatches:
+            print(f"[ERROR] {mismatches} pair(s) scored differently from OTSL and from HTML")
+            sys.exit(1)
+        return
+
+    config = {field: getattr(args, field) for field in CONFIG_FIELDS}
+    print(f"[INFO] {args.num_tables} table pairs per size, {args.cols} columns, span density {args.span_density}, "
+          f"text length {args.text_len}, perturbation {args.perturb}")
+    results = run_suite(args)
+
+    if args.output_json:
+        with open(args.output_json, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print(f"\n[INFO] Saved benchmark results to: {args.output_json}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            print(f"[ERROR] {args.compare} was recorded with different settings: {baseline['config']}")
+            sys.exit(2)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"[ERROR] Throughput regressed by more than {args.tolerance:.0%} at rows: {regressions}")
+            sys.exit(1)
+        print(f"[INFO] No throughput regression beyond {args.tolerance:.0%}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 10, 20, 40], help="Rows per table, one suite step each")
+    parser.add_argument("--num_tables", type=int, default=50, help="Number of synthetic table pairs per size")
+    parser.add_argument("--cols", type=int, default=8, help="Columns per table")
+    parser.add_argument("--span_density", type=float, default=0.1, help="Probability that a cell spans several columns")
+    parser.add_argument("--text_len", type=int, default=8, help="Maximum characters of cell text")
+    parser.add_argument("--perturb", type=float, default=0.1, help="Probability that a predicted cell differs from the GT")
+    parser.add_argument("--content_cost", choices=["exact", "levenshtein"], default="exact", help="Cell cost of the TED distance")
+    parser.add_argument("--kernel", choices=["scalar", "batched"], default="scalar", help="Tree edit distance engine")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions (best is reported)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output_json", type=str, default=None, help="Save the results, e.g. as a --compare baseline")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON from --output_json; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed fractional drop in nodes/sec for --compare")
+    parser.add_argument("--normalizers", action="store_true",
+                        help="Instead of the suite, time the legacy and one-pass normalizers on --rows x --cols tables")
+    parser.add_argument("--otsl", action="store_true",
+                        help="Instead of the suite, time structure TEDS of OTSL tables scored directly and via HTML")
+    parser.add_argument("--rows", type=int, default=20, help="Rows per table for --normalizers and --otsl")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,81 @@
+import numpy as np
+from tree_distance import label_name
+
+# Relabel costs for the standard (PubTabNet) TEDS content cost: two td cells
+# cost the normalized Levenshtein distance of their text, any other pair of
+# differing labels costs 1.
+#
+# Distances are computed for the distinct (pred text, GT text) pairs of a
+# table pair at once, vectorized over the pairs, and memoized by label id so
+# no string distance is computed twice in a process.
+
+_MEMO = {}
+_MEMO_SIZE = 1_000_000
+_CELL_PREFIX = "td:"
+
+
+def levenshtein(a_strings, b_strings):
+    # Edit distances between a_strings[k] and b_strings[k], as an array. One
+    # DP over character positions, each step a NumPy op across all pairs.
+    n = len(a_strings)
+    a_lens = np.array([len(s) for s in a_strings], dtype=np.int32)
+    b_lens = np.array([len(s) for s in b_strings], dtype=np.int32)
+    width = int(b_lens.max(initial=0))
+    a_chars = np.full((n, int(a_lens.max(initial=0))), -1, dtype=np.int32)
+    b_chars = np.full((n, width), -2, dtype=np.int32)
+    for k in range(n):
+        a_chars[k, :a_lens[k]] = [ord(c) for c in a_strings[k]]
+        b_chars[k, :b_lens[k]] = [ord(c) for c in b_strings[k]]
+
+    rows = np.arange(n)
+    result = b_lens.copy()  # distance to the empty prefix of a
+    prev = np.tile(np.arange(width + 1, dtype=np.int32), (n, 1))
+    for i in range(a_chars.shape[1]):
+        cur = np.empty_like(prev)
+        cur[:, 0] = i + 1
+        substitute = prev[:, :-1] + (a_chars[:, i:i + 1] != b_chars)
+        deleted = prev[:, 1:] + 1
+        best = np.minimum(substitute, deleted)
+        for j in range(width):
+            cur[:, j + 1] = np.minimum(best[:, j], cur[:, j] + 1)
+        done = a_lens == i + 1
+        result[done] = cur[rows[done], b_lens[done]]
+        prev = cur
+    return result
+
+
+def relabel_costs(a_labels, b_labels):
+    # Node-by-node relabel cost matrix (nested lists) for two content label
+    # sequences, as used by tree_distance.tree_edit_distance(relabel=...).
+    a_ids, a_rows = np.unique(a_labels, return_inverse=True)
+    b_ids, b_cols = np.unique(b_labels, return_inverse=True)
+    costs = np.where(np.equal.outer(a_ids, b_ids), 0.0, 1.0)
+    a_ids, b_ids = a_ids.tolist(), b_ids.tolist()
+    a_cells = [r for r, x in enumerate(a_ids) if label_name(x).startswith(_CELL_PREFIX)]
+    b_cells = [c for c, y in enumerate(b_ids) if label_name(y).startswith(_CELL_PREFIX)]
+
+    missing = []
+    for r in a_cells:
+        x = a_ids[r]
+        for c in b_cells:
+            y = b_ids[c]
+            if x == y:
+                continue
+            cost = _MEMO.get((x, y))
+            if cost is None:
+                missing.append((r, c))
+            else:
+                costs[r, c] = cost
+
+    if missing:
+        a_texts = [label_name(a_ids[r])[len(_CELL_PREFIX):] for r, _ in missing]
+        b_texts = [label_name(b_ids[c])[len(_CELL_PREFIX):] for _, c in missing]
+        lengths = np.maximum([len(s) for s in a_texts], [len(s) for s in b_texts])
+        normalized = levenshtein(a_texts, b_texts) / np.maximum(lengths, 1)
+        if len(_MEMO) + len(missing) > _MEMO_SIZE:
+            _MEMO.clear()
+        for (r, c), cost in zip(missing, normalized.tolist()):
+            costs[r, c] = cost
+            _MEMO[(a_ids[r], b_ids[c])] = cost
+
+    return costs[np.ix_(a_rows, b_cols)].tolist()
@@ -1,10 +1,29 @@
+import csv
+import gzip
 import json
+import os
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool
 from tqdm import tqdm
 from metric import TEDS
-from .utils import preprocess, clean_html
+from gt_cache import GTCache, compile_tree
+from result_cache import ResultCache, result_key
+
+try:
+    from table_codec import table_text
+except ImportError:
+    # Without table_codec (repository root not on the path) there is no
+    # conversion: each entry is read from the field of the selected format.
+    def table_text(entry, fmt, fields=None):
+        key = (fields or {}).get(fmt, fmt)
+        if entry.get(key) is None:
+            raise KeyError(f"Entry has no {key} field")
+        return entry[key]
 
 def load_json(path):
-    with open(path, 'r', encoding='utf-8') as f:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt', encoding='utf-8') as f:
         return json.load(f)
 
 def unwrap_ground_truth(gt_data):
@@ -12,30 +31,266 @@ def unwrap_ground_truth(gt_data):
         return gt_data["image"]
     return gt_data
 
-def build_dicts(pred_data, gt_data):
-    pred_dict = {entry["filename"]: entry["html"] for entry in pred_data}
-    gt_dict = {
-        entry["filename"]: entry["text_html_table"]
-        for entry in gt_data if entry.get("filename") and entry.get("text_html_table")
-    }
-    return pred_dict, gt_dict
+# JSON field holding the table, per input format, in prediction / GT entries.
+PRED_FIELDS = {"html": "html", "otsl": "otsl"}
+GT_FIELDS = {"html": "text_html_table", "otsl": "otsl"}
+
+def build_dicts(pred_data, gt_data, pred_format="html", gt_format="html"):
+    # Tables in the requested formats; an entry without that field is
+    # converted from another format it holds (see table_codec.table_text).
+    return build_pred_dict(pred_data, pred_format), build_gt_dict(gt_data, gt_format)
+
+def pred_table(entry, pred_format="html"):
+    # A prediction without any table (e.g. "html": null) maps to None and is
+    # reported as a failed file by evaluate_pairs.
+    try:
+        return table_text(entry, pred_format, PRED_FIELDS)
+    except KeyError:
+        return None
+
+def gt_table(entry, gt_format="html"):
+    # None for a GT entry without a table, which is left out of the GT.
+    try:
+        return table_text(entry, gt_format, GT_FIELDS) or None
+    except KeyError:
+        return None
 
-def evaluate_teds(pred_dict, gt_dict):
+def build_pred_dict(pred_data, pred_format="html"):
+    return {entry["filename"]: pred_table(entry, pred_format) for entry in pred_data if entry.get("filename")}
+
+def build_gt_dict(gt_data, gt_format="html"):
+    gt_dict = {}
+    for entry in gt_data:
+        table = gt_table(entry, gt_format)
+        if entry.get("filename") and table:
+            gt_dict[entry["filename"]] = table
+    return gt_dict
+
+def match_dicts(pred_dict, gt_dict):
     matched_files = sorted(set(pred_dict.keys()) & set(gt_dict.keys()))
+    pairs = ((fname, pred_dict[fname], gt_dict[fname]) for fname in matched_files)
+    return matched_files, pairs
+
+def evaluate_teds(pred_dict, gt_dict, n_jobs=1, gt_cache=None, batch_size=None, result_cache=None,
+                  result_cache_size=1_000_000, time_budget=None, max_nodes=None, content_cost="exact",
+                  kernel="scalar", pred_format="html", gt_format="html"):
+    matched_files, pairs = match_dicts(pred_dict, gt_dict)
+    records = evaluate_pairs(
+        matched_files, pairs, n_jobs=n_jobs, gt_cache=gt_cache, batch_size=batch_size,
+        result_cache=result_cache, result_cache_size=result_cache_size,
+        time_budget=time_budget, max_nodes=max_nodes, content_cost=content_cost, kernel=kernel,
+        pred_format=pred_format, gt_format=gt_format
+    )
+    scores_struc = [record["teds"] for record in records if not record["error"]]
+    scores_full = [record["ted"] for record in records if not record["error"]]
+    return scores_struc, scores_full
+
+def compile_gt(gt_dict, gt_format="html", n_jobs=1, gt_cache=None):
+    # {filename: full-content CompactTree or None} for every GT table, parsed
+    # once so several prediction files can be scored against the trees.
+    if gt_cache:
+        return GTCache(gt_cache, gt_format).compile(gt_dict)
+    n_jobs = os.cpu_count() if n_jobs == -1 else max(1, n_jobs)
+    items = [(table, gt_format) for table in gt_dict.values()]
+    if n_jobs == 1 or len(items) < 2:
+        trees = map(_compile_tree, items)
+        return dict(zip(gt_dict, tqdm(trees, total=len(items), desc="Loading GT trees")))
+    with Pool(n_jobs) as pool:
+        trees = pool.imap(_compile_tree, items, chunksize=max(1, len(items) // (n_jobs * 16)))
+        return dict(zip(gt_dict, tqdm(trees, total=len(items), desc="Loading GT trees")))
+
+def _compile_tree(item):
+    return compile_tree(*item)
+
+def evaluate_many(pred_dicts, gt_dict, n_jobs=1, gt_cache=None, result_cache=None, result_cache_size=1_000_000,
+                  time_budget=None, max_nodes=None, content_cost="exact", kernel="scalar",
+                  pred_format="html", gt_format="html"):
+    # Scores several prediction sets (pred_dicts: {name: pred_dict}, e.g. one
+    # per checkpoint) against one GT: the GT tables any of them match are
+    # compiled once, and all pairs go through a single evaluate_pairs call,
+    # so one process pool and one structure memo serve the whole sweep.
+    # Returns {name: records}, records as from evaluate_pairs.
+    matched = {}
+    for name, pred_dict in pred_dicts.items():
+        matched[name] = match_dicts(pred_dict, gt_dict)[0]
+        print(f"[INFO] {name}: matched {len(matched[name])} files.")
+    needed = set().union(*matched.values())
+    gt_trees = compile_gt({fname: gt_dict[fname] for fname in sorted(needed)}, gt_format, n_jobs, gt_cache)
+
+    all_files = [fname for files in matched.values() for fname in files]
+    pairs = (
+        (fname, pred_dicts[name][fname], gt_dict[fname])
+        for name, files in matched.items() for fname in files
+    )
+    records = evaluate_pairs(
+        all_files, pairs, n_jobs=n_jobs, result_cache=result_cache, result_cache_size=result_cache_size,
+        time_budget=time_budget, max_nodes=max_nodes, content_cost=content_cost, kernel=kernel,
+        pred_format=pred_format, gt_format=gt_format, gt_trees=gt_trees
+    )
+    results, start = {}, 0
+    for name, files in matched.items():
+        results[name] = records[start:start + len(files)]
+        start += len(files)
+    return results
+
+# Per-file record fields, in the column order of the per-file CSV.
+RECORD_FIELDS = [
+    "filename", "pred_nodes", "gt_nodes", "teds", "ted", "approximate", "error", "cached", "memo",
+    "parse", "normalize", "distance"
+]
+STAGES = ["parse", "normalize", "distance"]
+
+def evaluate_pairs(matched_files, pairs, n_jobs=1, gt_cache=None, batch_size=None, result_cache=None,
+                   result_cache_size=1_000_000, time_budget=None, max_nodes=None, content_cost="exact",
+                   kernel="scalar", pred_format="html", gt_format="html", gt_trees=None):
+    # pairs yields (filename, pred_html, gt_html) and is consumed batch_size
+    # pairs at a time (all at once by default), so a lazy generator such as
+    # streaming.stream_pairs keeps memory bounded by the batch. Returns one
+    # record (see RECORD_FIELDS) per pair; failed pairs carry the error and
+    # pairs over the time_budget / max_nodes budget are flagged approximate.
+    # gt_trees ({filename: tree}, see compile_gt) replaces parsing the GT.
     print(f"[INFO] Matched {len(matched_files)} files.")
     
-    teds_structure = TEDS()
-    teds_full = TEDS()
+    teds = TEDS(
+        n_jobs=n_jobs, time_budget=time_budget, max_nodes=max_nodes, content_cost=content_cost, kernel=kernel,
+        pred_format=pred_format, gt_format=gt_format
+    )
+    cache_mode = "both" if content_cost == "exact" else f"both:{content_cost}"
+    if (pred_format, gt_format) != ("html", "html"):
+        cache_mode += f":{pred_format}:{gt_format}"
+    cache = GTCache(gt_cache, gt_format) if gt_cache and gt_trees is None else None
+    results_db = ResultCache(result_cache, result_cache_size) if result_cache else None
+    batch_size = batch_size or max(len(matched_files), 1)
 
-    scores_struc, scores_full = [], []
+    print(f"[INFO] Calculating TEDS/TED with {teds.n_jobs} job(s).")
+    records = []
 
-    for fname in tqdm(matched_files, desc="Calculating TEDS/TED"):
-        try:
-            pred_html = preprocess(pred_dict[fname])
-            true_html = f"<html>{clean_html(gt_dict[fname])}</html>"
-            scores_struc.append(teds_structure.evaluate(pred_html, true_html, is_structure=True))
-            scores_full.append(teds_full.evaluate(pred_html, true_html, is_structure=False))
-        except Exception as e:
-            print(f"[ERROR] {fname}: {e}")
+    pairs = iter(pairs)
+    with tqdm(total=len(matched_files), desc="Calculating TEDS/TED") as progress:
+        while True:
+            batch = list(islice(pairs, batch_size))
+            if not batch:
+                break
+            results = [None] * len(batch)
+            cached = set()
+            todo = list(range(len(batch)))
+            # No prediction table: a failed file, left out of the averages.
+            for i in todo:
+                if batch[i][1] is None:
+                    results[i] = (None, "prediction has no table")
+            todo = [i for i in todo if results[i] is None]
+            if results_db:
+                # Pairs scored in an earlier run come straight from the cache;
+                # pairs without a prediction table are neither looked up nor
+                # counted as hits or misses.
+                keys = {i: result_key(batch[i][1], batch[i][2], cache_mode) for i in todo}
+                found = results_db.get_many(list(keys.values()))
+                for i, key in keys.items():
+                    if key in found:
+                        results[i] = (found[key], None)
+                        cached.add(i)
+                todo = [i for i in todo if results[i] is None]
 
-    return scores_struc, scores_full
+            jobs = []
+            for i in todo:
+                fname, pred, gt = batch[i]
+                if gt_trees is not None:
+                    gt = gt_trees[fname]
+                elif cache:
+                    gt = cache.get_tree(fname, gt)
+                jobs.append((pred, gt))
+            for i, result in zip(todo, teds.batch_evaluate_both(jobs, raw=True, details=True, return_errors=True)):
+                results[i] = result
+            if cache:
+                # Newly compiled GT trees go to disk with each batch, so memory
+                # stays bounded by the batch with --stream.
+                cache.flush()
+
+            if results_db:
+                # Approximate scores depend on the budget, so only exact ones are kept.
+                results_db.put_many([
+                    (keys[i], {field: results[i][0][field] for field in ("teds", "ted", "pred_nodes", "gt_nodes")})
+                    for i in todo if results[i][1] is None and not results[i][0]["approximate"]
+                ])
+
+            for i, (fname, _, _) in enumerate(batch):
+                details, error = results[i]
+                record = dict.fromkeys(RECORD_FIELDS, None)
+                record["approximate"] = False
+                record["memo"] = ""
+                record.update(details or {})
+                record.update(filename=fname, error=error or "", cached=i in cached)
+                if error is not None:
+                    print(f"[ERROR] {fname}: {error}")
+                records.append(record)
+            progress.update(len(batch))
+
+    if cache:
+        cache.report()
+    if results_db:
+        results_db.report()
+        results_db.close()
+
+    failed = sum(1 for record in records if record["error"])
+    if failed:
+        print(f"[WARN] {failed} file(s) failed and are excluded from the averages.")
+    memo = Counter(record["memo"] for record in records if record["memo"])
+    if memo:
+        lookups = sum(memo.values())
+        print(
+            f"[INFO] Structure memo: {memo['identical']} identical, {memo['hit']} hits, {memo['miss']} misses "
+            f"({(memo['identical'] + memo['hit']) / lookups * 100:.1f}% served without a DP)"
+        )
+    approximate = [record["filename"] for record in records if record["approximate"]]
+    if approximate:
+        print(f"[WARN] {len(approximate)} file(s) exceeded the time/size budget and got approximate scores: "
+              f"{', '.join(approximate[:10])}{' ...' if len(approximate) > 10 else ''}")
+
+    return records
+
+def write_per_file_csv(records, path):
+    # Records from several prediction files carry their "pred_path" column.
+    fields = (["pred_path"] if records and "pred_path" in records[0] else []) + RECORD_FIELDS
+    with open(path, mode='w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for record in records:
+            writer.writerow({
+                field: round(value, 6) if isinstance(value, float) else value
+                for field, value in record.items()
+            })
+    print(f"[INFO] Saved per-file results to: {path}")
+
+# Table-size buckets (pred + GT nodes) for the time histogram.
+SIZE_BUCKETS = [0, 50, 100, 200, 400, 800, 1600, 3200]
+
+def record_time(record):
+    return sum(record[stage] or 0.0 for stage in STAGES)
+
+def print_profile(records, stage_times=None, top_n=10):
+    # stage_times holds extra stages measured by the caller, e.g. "load".
+    totals = dict(stage_times or {})
+    for stage in STAGES:
+        totals[stage] = sum(record[stage] or 0.0 for record in records)
+    print("\n Stage timings (s, parse/normalize/distance summed over workers):")
+    print("  " + " | ".join(f"{stage} {seconds:.2f}" for stage, seconds in totals.items()))
+
+    scored = [record for record in records if not record["error"] and not record["cached"]]
+    if not scored:
+        return
+
+    print("\n Time by table size (pred + GT nodes):")
+    bounds = SIZE_BUCKETS + [float("inf")]
+    for low, high in zip(bounds, bounds[1:]):
+        bucket = [record_time(r) for r in scored if low <= r["pred_nodes"] + r["gt_nodes"] < high]
+        if not bucket:
+            continue
+        label = f"{low}+" if high == float("inf") else f"{low}-{high - 1}"
+        print(f"  {label:>10} nodes: {len(bucket):6d} files  {sum(bucket):9.2f}s total  {sum(bucket) / len(bucket):.4f}s mean")
+
+    print(f"\n Top {top_n} slowest files:")
+    for record in sorted(scored, key=record_time, reverse=True)[:top_n]:
+        print(
+            f"  {record['filename']}: {record_time(record):.3f}s "
+            f"({record['pred_nodes']} pred / {record['gt_nodes']} GT nodes, distance {record['distance']:.3f}s)"
+        )
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from otsl import otsl_to_tree
+from tqdm import tqdm
+from tree_distance import CompactTree, import_labels, label_name
+from utils import html_to_tree
+
+# Bump when html_to_tree or CompactTree change what a compiled GT tree is,
+# or when the file layout changes.
+CACHE_VERSION = 3
+
+# On-disk layout (one directory). Files are only ever appended to, so a
+# run that compiles new tables writes just those, batch by batch:
+#   index.json          {"version"}
+#   labels.bin          int32 structural label indices (into labels.jsonl) of
+#                       all trees, back to back
+#   content_labels.bin  int32 td:<text> label indices
+#   lmds.bin            int32 leftmost-leaf indices
+#   labels.jsonl        the label table, one JSON string per line
+#   entries.jsonl       one [filename, hash, offset, size] per line; a later
+#                       line for a filename replaces the earlier ones
+# flush() appends the arrays, then the new labels, then the entries, so an
+# interrupted flush leaves only data no entry refers to; the next flush
+# writes over it. The .bin files are memory-mapped, so a run only pages in
+# the trees it actually scores.
+#
+# A recompiled table (its GT HTML changed) leaves its old tree in the files.
+# compact() rewrites them with only the trees the entries refer to and the
+# labels those use; loading a cache compacts it once at least COMPACT_STALE
+# of its nodes are stale.
+_ARRAYS = ("labels", "content_labels", "lmds")
+COMPACT_STALE = 0.5
+# Array elements copied at a time by compact().
+_COPY_CHUNK = 1 << 22
+
+
+def content_hash(html):
+    return hashlib.sha1(html.encode("utf-8")).hexdigest()
+
+
+def compile_tree(table, input_format="html"):
+    # Full-content tree of one GT table, None if it cannot be parsed.
+    try:
+        if input_format == "otsl":
+            return otsl_to_tree(table, structure_only=False)
+        return html_to_tree(table, structure_only=False, clean=True)
+    except Exception:
+        return None
+
+
+def _read_lines(path):
+    # (JSON values of the lines of path, bytes they span). Reading stops at a
+    # partial last line, as an interrupted flush leaves.
+    items, size = [], 0
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                items.append(json.loads(line))
+                size += len(line)
+    return items, size
+
+
+class GTCache:
+    def __init__(self, path, input_format="html"):
+        # input_format="otsl" compiles the GT from OTSL strings instead of HTML.
+        self.path = path
+        self.input_format = input_format
+        self.entries = {}
+        self.arrays = {}
+        self.labels = []
+        self.label_index = {}
+        self.remap = np.empty(0, np.int32)
+        self.trees = {}
+        self.hits = 0
+        self.misses = 0
+        # Bytes of each file that belong to the cache; appends start there.
+        self.ends = None
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        index_path = self._file("index.json")
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != CACHE_VERSION:
+            print(f"[INFO] Ignoring GT cache at {self.path}: built by an older version.")
+            return
+        self.labels, labels_size = _read_lines(self._file("labels.jsonl"))
+        self.label_index = {label: i for i, label in enumerate(self.labels)}
+        self.remap = import_labels(self.labels)
+        entries, entries_size = _read_lines(self._file("entries.jsonl"))
+        self.ends = {"labels.jsonl": labels_size, "entries.jsonl": entries_size}
+        self._map_arrays()
+        for filename, digest, offset, size in entries:
+            self.entries[filename] = [digest, offset, size]
+        stored = len(self.arrays["lmds"])
+        if stored and self.stale_nodes() >= COMPACT_STALE * stored:
+            self.compact()
+
+    def stale_nodes(self):
+        # Nodes stored in the files that no entry refers to.
+        return len(self.arrays["lmds"]) - sum(size for _, _, size in self.entries.values())
+
+    def _map_arrays(self):
+        # Memory maps over the part of the .bin files all three arrays cover.
+        paths = {name: self._file(f"{name}.bin") for name in _ARRAYS}
+        length = min(os.path.getsize(path) // 4 if os.path.exists(path) else 0 for path in paths.values())
+        self.arrays = {
+            name: np.memmap(path, dtype=np.int32, mode="r", shape=(length,)) if length else np.empty(0, np.int32)
+            for name, path in paths.items()
+        }
+        self.ends.update({f"{name}.bin": length * 4 for name in _ARRAYS})
+
+    def _append(self, name, data):
+        # Writes data after the cache's part of the file, over anything an
+        # interrupted flush left there.
+        with open(self._file(name), "ab") as f:
+            f.truncate(self.ends[name])
+            f.write(data)
+        self.ends[name] += len(data)
+
+    def _cached_tree(self, filename, digest):
+        entry = self.entries.get(filename)
+        if entry is None or entry[0] != digest:
+            return False, None
+        _, offset, size = entry
+        if size == 0:
+            return True, None
+        span = slice(offset, offset + size)
+        tree = CompactTree(
+            self.remap[self.arrays["labels"][span]],
+            np.array(self.arrays["lmds"][span]),
+            self.remap[self.arrays["content_labels"][span]]
+        )
+        return True, tree
+
+    def get_tree(self, filename, html):
+        # The cached tree if this GT HTML was compiled before, else compiles
+        # it now. Newly compiled trees are held in memory until flush().
+        digest = content_hash(html)
+        found, tree = self._cached_tree(filename, digest)
+        if found:
+            self.hits += 1
+            return tree
+        self.misses += 1
+        tree = compile_tree(html, self.input_format)
+        self.trees[filename] = (digest, tree)
+        return tree
+
+    def compile(self, gt_dict):
+        # Returns {filename: CompactTree or None} for the whole of gt_dict.
+        trees = {
+            filename: self.get_tree(filename, html)
+            for filename, html in tqdm(gt_dict.items(), desc="Loading GT trees")
+        }
+        self.flush()
+        self.report()
+        return trees
+
+    def flush(self):
+        # Appends the trees compiled since the last flush to the cache files
+        # and drops them from memory.
+        if not self.trees:
+            return
+        if self.ends is None:
+            # New (or outdated) cache: start the files over.
+            os.makedirs(self.path, exist_ok=True)
+            for name in _ARRAYS:
+                # Arrays of the layout before version 3.
+                if os.path.exists(self._file(f"{name}.npy")):
+                    os.remove(self._file(f"{name}.npy"))
+            with open(self._file("index.json"), "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION}, f)
+            self.ends = {"labels.jsonl": 0, "entries.jsonl": 0}
+            self.ends.update({f"{name}.bin": 0 for name in _ARRAYS})
+
+        offset = self.ends["lmds.bin"] // 4
+        entries, parts = [], {name: [] for name in _ARRAYS}
+        for filename, (digest, tree) in self.trees.items():
+            size = 0 if tree is None else len(tree)
+            entries.append([filename, digest, offset, size])
+            if tree is not None:
+                parts["labels"].append(tree.labels)
+                parts["content_labels"].append(tree.content_labels)
+                parts["lmds"].append(tree.lmds)
+            offset += size
+        arrays = {name: np.concatenate(parts[name] or [np.empty(0, np.int32)]).astype(np.int32) for name in _ARRAYS}
+
+        # Label ids are process-local: store them as indices into the label
+        # table, adding the labels it does not have yet.
+        ids = np.unique(np.concatenate([arrays["labels"], arrays["content_labels"]]))
+        new_labels = [label for label in map(label_name, ids.tolist()) if label not in self.label_index]
+        for label in new_labels:
+            self.label_index[label] = len(self.labels)
+            self.labels.append(label)
+        table = np.array([self.label_index[label_name(i)] for i in ids.tolist()], dtype=np.int32)
+        for name in ("labels", "content_labels"):
+            arrays[name] = table[np.searchsorted(ids, arrays[name])]
+
+        for name in _ARRAYS:
+            self._append(f"{name}.bin", arrays[name].tobytes())
+        self._append("labels.jsonl", "".join(json.dumps(label) + "\n" for label in new_labels).encode("utf-8"))
+        self._append("entries.jsonl", "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8"))
+
+        self.remap = np.concatenate([self.remap, import_labels(new_labels)])
+        for filename, digest, offset, size in entries:
+            self.entries[filename] = [digest, offset, size]
+        self._map_arrays()
+        self.trees = {}
+
+    def compact(self):
+        # Rewrites the cache with only the live trees, in offset order, and
+        # the labels they use. Each file is replaced whole; index.json goes
+        # first and comes back last, so an interrupted compaction leaves a
+        # cache the next run starts over.
+        self.flush()
+        if self.ends is None:
+            return
+        stale = self.stale_nodes()
+        live = sorted((entry for entry in self.entries.items() if entry[1][2]), key=lambda item: item[1][1])
+        runs = []  # (start, end) of contiguous live spans
+        for _, (_, offset, size) in live:
+            if runs and runs[-1][1] == offset:
+                runs[-1][1] = offset + size
+            else:
+                runs.append([offset, offset + size])
+
+        def chunks(name):
+            for start, end in runs:
+                for chunk in range(start, end, _COPY_CHUNK):
+                    yield self.arrays[name][chunk:min(end, chunk + _COPY_CHUNK)]
+
+        used = np.zeros(len(self.labels), dtype=bool)
+        for name in ("labels", "content_labels"):
+            for chunk in chunks(name):
+                used[chunk] = True
+        new_ids = (np.cumsum(used) - 1).astype(np.int32)
+        labels = [label for label, keep in zip(self.labels, used.tolist()) if keep]
+
+        moved, position = {}, 0
+        for start, end in runs:
+            moved[start] = position
+            position += end - start
+        entries, run = [], 0
+        for filename, (digest, offset, size) in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            if size:
+                while runs[run][1] <= offset:
+                    run += 1
+                offset = moved[runs[run][0]] + offset - runs[run][0]
+            else:
+                offset = 0
+            entries.append([filename, digest, offset, size])
+
+        os.remove(self._file("index.json"))
+        for name in _ARRAYS:
+            with open(self._file(f"{name}.bin.tmp"), "wb") as f:
+                for chunk in chunks(name):
+                    f.write((new_ids[chunk] if name != "lmds" else np.asarray(chunk)).tobytes())
+        with open(self._file("labels.jsonl.tmp"), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(label) + "\n" for label in labels)
+        with open(self._file("entries.jsonl.tmp"), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        self.arrays = {}
+        for name in [f"{name}.bin" for name in _ARRAYS] + ["labels.jsonl", "entries.jsonl"]:
+            os.replace(self._file(name + ".tmp"), self._file(name))
+        with open(self._file("index.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION}, f)
+
+        self.entries, self.labels, self.label_index = {}, [], {}
+        self.remap = np.empty(0, np.int32)
+        self._load()
+        print(f"[INFO] Compacted GT cache {self.path}: dropped {stale} stale node(s).")
+
+    def report(self):
+        print(f"[INFO] GT cache {self.path}: {self.hits} reused, {self.misses} compiled.")
@@ -1,70 +1,387 @@
 
-from bs4 import BeautifulSoup
-from lxml import etree
-import zss
+import os
+import time
+from collections import Counter, OrderedDict
+from multiprocessing import Pool
+
+from cell_distance import relabel_costs
+from otsl import otsl_to_tree
+from tree_distance import (
+    BUCKET_CELLS, BudgetExceeded, CompactTree, anchored_edit_distance, batch_tree_edit_distance, distance_bounds,
+    grid_distance, same_shape_distance, strip_common, tree_edit_distance
+)
+from utils import html_to_tree
+
+# Relabel costs for td cells in the full-content score (see TEDS.__init__).
+CONTENT_COSTS = ("exact", "levenshtein")
+# Tree edit distance engines for batch_evaluate / batch_evaluate_both.
+KERNELS = ("scalar", "batched")
+# Table formats the prediction / ground-truth inputs may be given in.
+INPUT_FORMATS = ("html", "otsl")
+
+# LRU memo of structure-only distances, keyed by the pair of structure
+# hashes; shared by all TEDS instances in a process.
+STRUCTURE_MEMO_SIZE = 100_000
+_STRUCTURE_MEMO = OrderedDict()
+
 
 class TEDS:
-    def __init__(self, n_jobs=1):
-        self.n_jobs = n_jobs
+    def __init__(self, n_jobs=1, time_budget=None, max_nodes=None, content_cost="exact", kernel="scalar",
+                 pred_format="html", gt_format="html"):
+        # A pair taking longer than time_budget seconds, or with a tree of
+        # more than max_nodes nodes, gets the bound-derived approximate score
+        # instead of the exact one (see evaluate_both(details=True)).
+        # content_cost sets the full-content relabel cost of two td cells:
+        # "exact" is 0/1 text equality, "levenshtein" the normalized edit
+        # distance of their text as in the published TEDS metric.
+        # kernel="batched" makes the batch methods parse a chunk of pairs
+        # first and run all their DPs together in the NumPy kernel
+        # (tree_distance.batch_tree_edit_distance); scores are identical.
+        # pred_format / gt_format="otsl" reads that side as OTSL token
+        # strings, built into the same trees as the equivalent HTML.
+        if content_cost not in CONTENT_COSTS:
+            raise ValueError(f"content_cost must be one of {CONTENT_COSTS}, got {content_cost!r}")
+        if kernel not in KERNELS:
+            raise ValueError(f"kernel must be one of {KERNELS}, got {kernel!r}")
+        for name, value in (("pred_format", pred_format), ("gt_format", gt_format)):
+            if value not in INPUT_FORMATS:
+                raise ValueError(f"{name} must be one of {INPUT_FORMATS}, got {value!r}")
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else max(1, n_jobs)
+        self.time_budget = time_budget
+        self.max_nodes = max_nodes
+        self.content_cost = content_cost
+        self.kernel = kernel
+        self.pred_format = pred_format
+        self.gt_format = gt_format
+        # Distances precomputed by the batched kernel, by (pred hash, GT hash, content).
+        self._batched = {}
+        # Structure-only distances: "identical" skeletons, memo "hit"s, "miss"es.
+        self.memo_stats = Counter()
+
+    def evaluate(self, pred, gt, is_structure=True, raw=False, threshold=None, approximate=False):
+        # raw=True takes uncleaned prediction / ground-truth HTML and applies
+        # preprocess() / clean_html() while building the trees. Either side
+        # may also be an already compiled CompactTree (see gt_cache.py).
+        # threshold=t returns whether the score is >= t, running the exact
+        # DP only when the distance bounds cannot decide; approximate=True
+        # returns the bound-derived score, which never exceeds the exact one.
+        deadline = self._deadline()
+        pred_tree = self._pred_tree(pred, is_structure, raw)
+        gt_tree = self._gt_tree(gt, is_structure, raw)
 
-    def evaluate(self, pred, gt, is_structure=True):
-        pred_tree = self._html2tree(pred, is_structure)
-        gt_tree = self._html2tree(gt, is_structure)
+        if pred_tree is None or gt_tree is None:
+            return 0.0 >= threshold if threshold is not None else 0.0
+
+        content = not is_structure
+        if content:
+            pred_tree, gt_tree = pred_tree.content(), gt_tree.content()
+        if approximate:
+            return self._approximate_similarity(pred_tree, gt_tree)
+        if threshold is not None:
+            return self._above_threshold(pred_tree, gt_tree, threshold, deadline, content)
+        return self._budgeted_similarity(pred_tree, gt_tree, deadline, content)[0]
+
+    def evaluate_both(self, pred, gt, raw=False, details=False):
+        # Structure-only and full-content scores from a single parse per side.
+        # details=True returns a dict with the scores, node counts, whether
+        # the time/size budget forced approximate scores and the seconds spent
+        # per stage (parse, normalize, distance), and how the structure memo
+        # served the TEDS distance ("identical", "hit" or "miss").
+        deadline = self._deadline()
+        timings = {"parse": 0.0, "normalize": 0.0, "distance": 0.0} if details else None
+        pred_tree = self._pred_tree(pred, False, raw, timings)
+        gt_tree = self._gt_tree(gt, False, raw, timings)
 
+        approximate = False
+        memo_before = dict(self.memo_stats)
         if pred_tree is None or gt_tree is None:
-            return 0.0
-
-        dist = zss.simple_distance(
-            pred_tree, gt_tree,
-            get_children=lambda n: n.children,
-            get_label=lambda n: n.label
-        )
-        max_dist = zss.simple_distance(
-            gt_tree, None,
-            get_children=lambda n: n.children,
-            get_label=lambda n: n.label
-        )
+            scores = (0.0, 0.0)
+        else:
+            start = time.perf_counter()
+            teds, approximate = self._budgeted_similarity(pred_tree, gt_tree, deadline)
+            if approximate:
+                ted = self._approximate_similarity(pred_tree.content(), gt_tree.content())
+            else:
+                ted, approximate = self._budgeted_similarity(
+                    pred_tree.content(), gt_tree.content(), deadline, content=True
+                )
+            scores = (teds, ted)
+            if details:
+                timings["distance"] = time.perf_counter() - start
+
+        if not details:
+            return scores
+        return {
+            "teds": scores[0],
+            "ted": scores[1],
+            "pred_nodes": 0 if pred_tree is None else len(pred_tree),
+            "gt_nodes": 0 if gt_tree is None else len(gt_tree),
+            "approximate": approximate,
+            "memo": next((k for k, v in self.memo_stats.items() if v != memo_before.get(k, 0)), ""),
+            **timings
+        }
+
+    def batch_evaluate(self, pairs, is_structure=True, raw=False, threshold=None, approximate=False,
+                       return_errors=False):
+        jobs = [(pred, gt, is_structure, raw, threshold, approximate) for pred, gt in pairs]
+        return self._run_batch("evaluate", jobs, return_errors)
+
+    def batch_evaluate_both(self, pairs, raw=False, details=False, return_errors=False):
+        return self._run_batch("evaluate_both", [(pred, gt, raw, details) for pred, gt in pairs], return_errors)
+
+    def _run_batch(self, method, jobs, return_errors):
+        # Scores jobs in input order. With n_jobs > 1 the jobs are dispatched
+        # largest first, in chunks, to a process pool so the big tables don't
+        # straggle at the end of the run.
+        settings = {
+            "time_budget": self.time_budget, "max_nodes": self.max_nodes,
+            "content_cost": self.content_cost, "kernel": self.kernel,
+            "pred_format": self.pred_format, "gt_format": self.gt_format
+        }
+        order = sorted(range(len(jobs)), key=lambda i: _job_size(jobs[i]), reverse=True)
+        results = [None] * len(jobs)
+        if self.kernel == "batched":
+            # Largest first also puts similar sizes in a chunk (and a kernel bucket).
+            parts = 1 if self.n_jobs <= 1 else self.n_jobs * 4
+            size = min(BATCH_CHUNK, max(1, -(-len(jobs) // parts)))
+            starts = range(0, len(order), size)
+            chunks = [(method, [jobs[i] for i in order[start:start + size]], settings) for start in starts]
+            for start, chunk_results in zip(starts, self._map(_evaluate_chunk, chunks, 1)):
+                for i, result in zip(order[start:start + size], chunk_results):
+                    results[i] = result
+        else:
+            chunksize = max(1, len(jobs) // (self.n_jobs * 16))
+            scored = self._map(_evaluate_job, [(method, jobs[i], settings) for i in order], chunksize)
+            for i, result in zip(order, scored):
+                results[i] = result
+
+        if return_errors:
+            return results
+        for score, error in results:
+            if error is not None:
+                raise RuntimeError(error)
+        return [score for score, _ in results]
+
+    def _map(self, fn, items, chunksize):
+        if self.n_jobs <= 1 or len(items) < 2:
+            yield from map(fn, items)
+            return
+        with Pool(self.n_jobs) as pool:
+            yield from pool.imap(fn, items, chunksize=chunksize)
+
+    def _evaluate_chunk(self, method, jobs):
+        # The batched kernel: parses every pair of the chunk, computes all the
+        # distances its jobs will need in one batch_tree_edit_distance call
+        # per label kind, then runs the jobs, which find them in _batched.
+        timings = [{"parse": 0.0, "normalize": 0.0} for _ in jobs]
+        parsed = []
+        requests = {False: {}, True: {}}
+        grid_time = 0.0
+        for args, job_timings in zip(jobs, timings):
+            if method == "evaluate":
+                pred, gt, is_structure, raw = args[:4]
+                structure_only = is_structure
+                # Threshold and approximate jobs mostly avoid the DP.
+                kinds = [] if args[4] is not None or args[5] else [not is_structure]
+            else:
+                pred, gt, raw = args[:3]
+                structure_only = False
+                kinds = [False, True]
+            pred_tree = self._pred_tree(pred, structure_only, raw, job_timings)
+            gt_tree = self._gt_tree(gt, structure_only, raw, job_timings)
+            parsed.append((pred_tree, gt_tree) + tuple(args[2:]))
+            if pred_tree is None or gt_tree is None or not self._batchable(pred_tree, gt_tree):
+                continue
+            for content in kinds:
+                a, b = (pred_tree.content(), gt_tree.content()) if content else (pred_tree, gt_tree)
+                key = (a.structure_hash(), b.structure_hash(), content)
+                if content and self.content_cost == "exact" and same_shape_distance(a, b) is not None:
+                    continue
+                if not content and (key[0] == key[1] or key[:2] in _STRUCTURE_MEMO or key in self._batched):
+                    continue
+                if not content:
+                    # Grid trees take the row DP rather than the kernel.
+                    start = time.perf_counter()
+                    dist = grid_distance(a, b)
+                    grid_time += time.perf_counter() - start
+                    if dist is not None:
+                        self._batched[key] = dist
+                        continue
+                requests[content].setdefault(key, (a, b))
+
+        start = time.perf_counter()
+        for content, requested in requests.items():
+            relabel = relabel_costs if content and self.content_cost == "levenshtein" else None
+            pairs = list(requested.values())
+            if relabel is None:
+                # The kernel only needs to run on the rows that differ.
+                pairs = [strip_common(a, b) for a, b in pairs]
+            distances = batch_tree_edit_distance(pairs, relabel)
+            self._batched.update(zip(requested.keys(), distances))
+        kernel_share = (time.perf_counter() - start + grid_time) / max(len(jobs), 1)
+
+        results = []
+        for args, job_timings in zip(parsed, timings):
+            try:
+                result = getattr(self, method)(*args)
+                if isinstance(result, dict):
+                    result.update(job_timings)
+                    result["distance"] += kernel_share
+                results.append((result, None))
+            except Exception as e:
+                results.append((None, str(e)))
+        self._batched = {}
+        return results
+
+    def _batchable(self, pred_tree, gt_tree):
+        if self.max_nodes is not None and max(len(pred_tree), len(gt_tree)) > self.max_nodes:
+            return False
+        # Keeps pairs the deadline should be able to stop on the scalar path.
+        return self.time_budget is None or len(pred_tree) * len(gt_tree) <= BUCKET_CELLS
+
+    def _tree_distance(self, pred_tree, gt_tree, deadline=None, content=False):
+        dist = self._batched.get((pred_tree.structure_hash(), gt_tree.structure_hash(), content))
+        if dist is not None:
+            return dist
+        if content and self.content_cost == "levenshtein":
+            return tree_edit_distance(pred_tree, gt_tree, deadline, relabel_costs)
+        # Same structure: the content trees differ only in td labels.
+        dist = same_shape_distance(pred_tree, gt_tree)
+        if dist is None and not content:
+            dist = grid_distance(pred_tree, gt_tree, deadline)
+        if dist is not None:
+            return dist
+        return anchored_edit_distance(pred_tree, gt_tree, lambda a, b: self._exact_distance(a, b, deadline))
+
+    def _exact_distance(self, a, b, deadline=None):
+        # Plain table/tr/td structure trees (all OTSL tables) take the row DP.
+        dist = grid_distance(a, b, deadline)
+        if dist is None:
+            dist = tree_edit_distance(a, b, deadline)
+        return dist
+
+    def _deadline(self):
+        return None if self.time_budget is None else time.perf_counter() + self.time_budget
+
+    def _budgeted_similarity(self, pred_tree, gt_tree, deadline=None, content=False):
+        # (score, approximate): the exact score, or the approximate one if
+        # the pair is over max_nodes or the DP runs past the deadline.
+        # Memoized structure distances are always exact.
+        if not content:
+            dist = self._memo_lookup(pred_tree, gt_tree)
+            if dist is not None:
+                return self._score(dist, gt_tree), False
+        if self.max_nodes is not None and max(len(pred_tree), len(gt_tree)) > self.max_nodes:
+            return self._approximate_similarity(pred_tree, gt_tree), True
+        try:
+            return self._similarity(pred_tree, gt_tree, deadline, content), False
+        except BudgetExceeded:
+            return self._approximate_similarity(pred_tree, gt_tree), True
+
+    def _similarity(self, pred_tree, gt_tree, deadline=None, content=False):
+        if content:
+            dist = self._tree_distance(pred_tree, gt_tree, deadline, content=True)
+        else:
+            dist = self._structure_distance(pred_tree, gt_tree, deadline)
+        return self._score(dist, gt_tree)
+
+    def _score(self, dist, gt_tree):
+        max_dist = len(gt_tree)
         score = 1 - (dist / max_dist) if max_dist != 0 else 1.0
         return score
 
-    def _html2tree(self, html, structure_only=True):
+    def _memo_lookup(self, pred_tree, gt_tree):
+        # Identical skeletons are at distance 0 without a lookup.
+        key = (pred_tree.structure_hash(), gt_tree.structure_hash())
+        if key[0] == key[1]:
+            self.memo_stats["identical"] += 1
+            return 0
+        dist = _STRUCTURE_MEMO.get(key)
+        if dist is not None:
+            _STRUCTURE_MEMO.move_to_end(key)
+            self.memo_stats["hit"] += 1
+        return dist
+
+    def _structure_distance(self, pred_tree, gt_tree, deadline=None):
+        dist = self._memo_lookup(pred_tree, gt_tree)
+        if dist is not None:
+            return dist
+        self.memo_stats["miss"] += 1
+        dist = self._tree_distance(pred_tree, gt_tree, deadline)
+        _STRUCTURE_MEMO[(pred_tree.structure_hash(), gt_tree.structure_hash())] = dist
+        if len(_STRUCTURE_MEMO) > STRUCTURE_MEMO_SIZE:
+            _STRUCTURE_MEMO.popitem(last=False)
+        return dist
+
+    def _approximate_similarity(self, pred_tree, gt_tree):
+        _, upper = distance_bounds(pred_tree, gt_tree)
+        max_dist = len(gt_tree)
+        return 1 - (upper / max_dist) if max_dist != 0 else 1.0
+
+    def _above_threshold(self, pred_tree, gt_tree, threshold, deadline=None, content=False):
+        max_dist = len(gt_tree)
+        if max_dist != 0:
+            weighted = content and self.content_cost == "levenshtein"
+            lower, upper = distance_bounds(pred_tree, gt_tree, weighted)
+            if 1 - (lower / max_dist) < threshold:
+                return False
+            if 1 - (upper / max_dist) >= threshold:
+                return True
+        return self._budgeted_similarity(pred_tree, gt_tree, deadline, content)[0] >= threshold
+
+    def _pred_tree(self, pred, structure_only, raw, timings=None):
+        if self.pred_format == "otsl":
+            return self._otsl2tree(pred, structure_only, timings)
+        return self._html2tree(pred, structure_only, clean=raw, strip_attributes=raw, timings=timings)
+
+    def _gt_tree(self, gt, structure_only, raw, timings=None):
+        if self.gt_format == "otsl":
+            return self._otsl2tree(gt, structure_only, timings)
+        return self._html2tree(gt, structure_only, clean=raw, timings=timings)
+
+    def _html2tree(self, html, structure_only=True, clean=False, strip_attributes=False, timings=None):
+        if isinstance(html, CompactTree):
+            return html
         try:
-            soup = BeautifulSoup(html, "lxml")
-            root = soup.find("table")
-            if not root:
-                return None
-            element = self._build_tree(root, structure_only)
-            return element
+            return html_to_tree(html, structure_only, clean, strip_attributes, timings)
         except Exception:
             return None
 
-    def _build_tree(self, node, structure_only):
-        label = node.name
-        if not structure_only:
-            if node.name == 'td':
-                label += ':' + (node.get_text().strip() or '')
-        tree_node = TreeNode(label)
+    def _otsl2tree(self, otsl, structure_only=True, timings=None):
+        if isinstance(otsl, CompactTree):
+            return otsl
+        try:
+            return otsl_to_tree(otsl, structure_only, timings)
+        except Exception:
+            return None
 
-        for child in node.children:
-            if isinstance(child, str):
-                continue
-            subtree = self._build_tree(child, structure_only)
-            if subtree:
-                tree_node.add_child(subtree)
 
-        return tree_node
+def clear_structure_memo():
+    _STRUCTURE_MEMO.clear()
+
+
+# Rough HTML characters per tree node, to rank jobs mixing HTML and trees.
+_NODE_CHARS = 10
+# Most pairs parsed and scored together by one kernel="batched" chunk.
+BATCH_CHUNK = 512
+
 
+def _job_size(args):
+    pred, gt = args[:2]
+    return sum(
+        len(side) * _NODE_CHARS if isinstance(side, CompactTree) else len(side or "")
+        for side in (pred, gt)
+    )
 
-class TreeNode:
-    def __init__(self, label):
-        self.label = label
-        self.children = []
 
-    def add_child(self, node):
-        self.children.append(node)
+def _evaluate_chunk(chunk):
+    method, jobs, settings = chunk
+    return TEDS(**settings)._evaluate_chunk(method, jobs)
 
-    def get_children(self):
-        return self.children
 
-    def get_label(self):
-        return self.label
+def _evaluate_job(job):
+    method, args, settings = job
+    try:
+        return getattr(TEDS(**settings), method)(*args), None
+    except Exception as e:
+        return None, str(e)
@@ -0,0 +1,100 @@
+import re
+import time
+
+import numpy as np
+from tree_distance import CompactTree, intern_label
+
+try:
+    from table_codec import parse_otsl, to_html
+except ImportError:
+    parse_otsl = to_html = None
+
+# OTSL (Optimized Table Structure Language) describes a table as a grid of
+# cell tokens, row by row, each row closed by <nl>:
+#   fcel  cell with content (its text follows the token)
+#   ecel  empty cell
+#   lcel  merged with the cell to its left (colspan)
+#   ucel  merged with the cell above (rowspan)
+#   xcel  merged with both (2D span)
+# e.g. "<fcel>Year<fcel>Total<lcel><nl><fcel>2019<fcel>12<fcel>3.4<nl>".
+# ched/rhed/srow (column header, row header, section row) are content cells
+# as well, as written by some OTSL producers. Parsing is done by the shared
+# table_codec package (repository root), into its TableGrid; without it,
+# trees come from a plain scan of the tokens (scan_otsl) and only
+# otsl_to_html is unavailable.
+#
+# The trees built here are the ones utils.html_to_tree builds from the
+# equivalent HTML table: a td per fcel/ecel, a tr per row, the table root,
+# spans not represented (clean_html drops colspan/rowspan). Scores are
+# therefore the same as on the HTML, without generating or parsing it.
+
+_TOKEN = re.compile(r"<(fcel|ecel|lcel|ucel|xcel|nl|ched|rhed|srow)>")
+_CELL_TOKENS = {"fcel", "ecel", "ched", "rhed", "srow"}
+
+
+class CellRows:
+    # What grid_to_tree reads of a TableGrid: cells per row (span tokens
+    # excluded) and the text of each cell.
+    def __init__(self, sizes, texts):
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.texts = texts
+
+    def row_sizes(self):
+        return self.sizes
+
+
+def scan_otsl(otsl):
+    # CellRows of an OTSL string, read as table_codec.parse_otsl reads it.
+    parts = _TOKEN.split(otsl)
+    sizes, texts, size = [], [], 0
+    for token, text in zip(parts[1::2], parts[2::2]):
+        if token == "nl":
+            sizes.append(size)
+            size = 0
+        elif token in _CELL_TOKENS:
+            size += 1
+            texts.append("" if token == "ecel" else " ".join(text.split()))
+    if len(parts) > 1 and parts[-2] != "nl":
+        sizes.append(size)
+    return CellRows(sizes, texts)
+
+
+def grid_to_tree(grid, structure_only=True):
+    # CompactTree of a table_codec.TableGrid (or CellRows), or None if it has
+    # no rows.
+    sizes = grid.row_sizes()
+    if len(sizes) == 0:
+        return None
+    n = int(sizes.sum()) + len(sizes) + 1
+    ends = np.cumsum(sizes + 1) - 1
+    labels = np.full(n, intern_label("td"), dtype=np.int32)
+    labels[ends] = intern_label("tr")
+    labels[-1] = intern_label("table")
+    lmds = np.arange(n, dtype=np.int32)
+    lmds[ends] = ends - sizes
+    lmds[-1] = 0
+    if structure_only:
+        return CompactTree(labels, lmds)
+    content_labels = labels.copy()
+    cells = np.ones(n, dtype=bool)
+    cells[ends] = False
+    cells[-1] = False
+    content_labels[cells] = [intern_label("td:" + text) for text in grid.texts]
+    return CompactTree(labels, lmds, content_labels)
+
+
+def otsl_to_tree(otsl, structure_only=True, timings=None):
+    # CompactTree of the table, or None if otsl has no tokens. timings, as in
+    # html_to_tree, accumulates the seconds spent under "normalize".
+    start = time.perf_counter()
+    tree = grid_to_tree((parse_otsl or scan_otsl)(otsl), structure_only)
+    if timings is not None:
+        timings["normalize"] = timings.get("normalize", 0.0) + time.perf_counter() - start
+    return tree
+
+
+def otsl_to_html(otsl):
+    # The equivalent HTML table, spans written as colspan/rowspan.
+    if to_html is None:
+        raise ImportError("otsl_to_html needs the table_codec package (repository root on the path)")
+    return to_html(parse_otsl(otsl))
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+# Bump when scores or the format of the stored records change.
+RESULT_VERSION = 3
+
+
+def result_key(pred_html, gt_html, mode):
+    # Whitespace runs never change a score (both preprocess and clean_html
+    # collapse them), so they are collapsed before hashing.
+    parts = [str(RESULT_VERSION), mode]
+    parts += [' '.join(html.split()) if isinstance(html, str) else "" for html in (pred_html, gt_html)]
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    # SQLite-backed score cache keyed by result_key, evicting the least
+    # recently used rows once it holds more than max_entries.
+    def __init__(self, path, max_entries=1_000_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        unique = list(set(keys))
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update((key, json.loads(value)) for key, value in rows)
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            self.conn.commit()
+        hits = sum(key in found for key in keys)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO results (key, value, last_used) VALUES (?, ?, ?)",
+            [(key, json.dumps(value), now) for key, value in items]
+        )
+        self.conn.commit()
+        self._evict()
+
+    def _evict(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            self.conn.commit()
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        print(f"[INFO] Result cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)")
+
+    def close(self):
+        self.conn.close()
@@ -1,17 +1,59 @@
 import argparse
 import csv
-from docfm_evaluation.evaluate import load_json, unwrap_ground_truth, build_dicts, evaluate_teds
+import glob
+import time
+from docfm_evaluation.evaluate import (
+    load_json, unwrap_ground_truth, build_dicts, build_pred_dict, build_gt_dict,
+    match_dicts, evaluate_pairs, evaluate_many, write_per_file_csv, print_profile
+)
+from docfm_evaluation.streaming import stream_pairs
 
-def main(args):
-    preds = load_json(args.pred_path)
-    raw_gt = load_json(args.gt_path)
-    gts = unwrap_ground_truth(raw_gt)
+# Columns of the --output_csv comparison written for several prediction files.
+COMPARISON_FIELDS = ["pred_path", "files", "failed", "avg_teds", "avg_ted"]
 
-    pred_dict, gt_dict = build_dicts(preds, gts)
-    scores_struc, scores_full = evaluate_teds(pred_dict, gt_dict)
+def expand_paths(patterns):
+    # Prediction paths from --pred_path values, globs expanded (sorted).
+    paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if path not in paths:
+                paths.append(path)
+    return paths
 
+def averages(records):
+    scores_struc = [record["teds"] for record in records if not record["error"]]
+    scores_full = [record["ted"] for record in records if not record["error"]]
     avg_teds = sum(scores_struc) / len(scores_struc) if scores_struc else 0.0
     avg_ted = sum(scores_full) / len(scores_full) if scores_full else 0.0
+    return avg_teds, avg_ted
+
+def main(args):
+    if len(args.pred_path) > 1:
+        return main_many(args)
+    args.pred_path = args.pred_path[0]
+    start = time.perf_counter()
+    if args.stream:
+        matched_files, pairs = stream_pairs(args.pred_path, args.gt_path, args.pred_format, args.gt_format)
+    else:
+        preds = load_json(args.pred_path)
+        raw_gt = load_json(args.gt_path)
+        gts = unwrap_ground_truth(raw_gt)
+
+        pred_dict, gt_dict = build_dicts(preds, gts, args.pred_format, args.gt_format)
+        matched_files, pairs = match_dicts(pred_dict, gt_dict)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    records = evaluate_pairs(
+        matched_files, pairs, n_jobs=args.n_jobs, gt_cache=args.gt_cache,
+        batch_size=args.batch_size if args.stream else None,
+        result_cache=args.result_cache, result_cache_size=args.result_cache_size,
+        time_budget=args.time_budget, max_nodes=args.max_nodes, content_cost=args.content_cost,
+        kernel=args.kernel, pred_format=args.pred_format, gt_format=args.gt_format
+    )
+    scoring_time = time.perf_counter() - start
+
+    avg_teds, avg_ted = averages(records)
 
     print(f"\n Average TEDS (structure only): {avg_teds:.4f}")
     print(f" Average TED  (full table):     {avg_ted:.4f}")
@@ -26,10 +68,83 @@ def main(args):
             })
         print(f"\n[INFO] Saved results to: {args.output_csv}")
 
+    if args.per_file_csv:
+        write_per_file_csv(records, args.per_file_csv)
+    if args.profile:
+        print_profile(records, {"load": load_time, "scoring (wall)": scoring_time}, top_n=args.top_n)
+
+def main_many(args):
+    # Several prediction files against one GT: the GT is loaded and compiled
+    # once, every file is scored in the same process pool, and --output_csv
+    # gets one row per prediction file.
+    start = time.perf_counter()
+    gt_dict = build_gt_dict(unwrap_ground_truth(load_json(args.gt_path)), args.gt_format)
+    pred_dicts = {path: build_pred_dict(load_json(path), args.pred_format) for path in args.pred_path}
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = evaluate_many(
+        pred_dicts, gt_dict, n_jobs=args.n_jobs, gt_cache=args.gt_cache,
+        result_cache=args.result_cache, result_cache_size=args.result_cache_size,
+        time_budget=args.time_budget, max_nodes=args.max_nodes, content_cost=args.content_cost,
+        kernel=args.kernel, pred_format=args.pred_format, gt_format=args.gt_format
+    )
+    scoring_time = time.perf_counter() - start
+
+    rows = []
+    for path, records in results.items():
+        avg_teds, avg_ted = averages(records)
+        failed = sum(1 for record in records if record["error"])
+        rows.append({
+            "pred_path": path, "files": len(records), "failed": failed,
+            "avg_teds": round(avg_teds, 4), "avg_ted": round(avg_ted, 4)
+        })
+
+    width = max([len("Prediction file")] + [len(row["pred_path"]) for row in rows])
+    print(f"\n {'Prediction file':<{width}}  {'Files':>6}  {'TEDS':>6}  {'TED':>6}")
+    for row in rows:
+        print(f" {row['pred_path']:<{width}}  {row['files']:>6}  {row['avg_teds']:>6.4f}  {row['avg_ted']:>6.4f}")
+
+    if args.output_csv:
+        with open(args.output_csv, mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=COMPARISON_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"\n[INFO] Saved comparison to: {args.output_csv}")
+
+    records = [dict(record, pred_path=path) for path, path_records in results.items() for record in path_records]
+    if args.per_file_csv:
+        write_per_file_csv(records, args.per_file_csv)
+    if args.profile:
+        print_profile(records, {"load": load_time, "scoring (wall)": scoring_time}, top_n=args.top_n)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--pred_path", type=str, required=True, help="Path to predicted JSON file")
+    parser.add_argument("--pred_path", type=str, nargs="+", required=True,
+                        help="Path(s) or glob(s) of predicted JSON files; several are scored against one GT load")
     parser.add_argument("--gt_path", type=str, required=True, help="Path to ground truth JSON file")
     parser.add_argument("--output_csv", type=str, default="teds_scores.csv", help="Output CSV path")
+    parser.add_argument("--n_jobs", type=int, default=1, help="Worker processes for TEDS scoring (-1 = all cores)")
+    parser.add_argument("--gt_cache", type=str, default=None, help="Directory for compiled GT trees, reused across runs")
+    parser.add_argument("--stream", action="store_true", help="Index the JSON files and read pairs lazily (bounded memory)")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Pairs held in memory at once with --stream")
+    parser.add_argument("--result_cache", type=str, default=None, help="SQLite file caching per-pair scores across runs")
+    parser.add_argument("--result_cache_size", type=int, default=1_000_000, help="Max cached pairs before LRU eviction")
+    parser.add_argument("--content_cost", choices=["exact", "levenshtein"], default="exact",
+                        help="Full-content cost of two differing cells: 0/1 text equality, or normalized Levenshtein distance as in the published TEDS")
+    parser.add_argument("--kernel", choices=["scalar", "batched"], default="scalar",
+                        help="Tree edit distance engine: per pair, or the NumPy kernel batching many pairs (same scores)")
+    parser.add_argument("--pred_format", choices=["html", "otsl"], default="html",
+                        help="Read predictions from the \"html\" field, or OTSL token strings from the \"otsl\" field")
+    parser.add_argument("--gt_format", choices=["html", "otsl"], default="html",
+                        help="Read the GT from the \"text_html_table\" field, or OTSL from the \"otsl\" field")
+    parser.add_argument("--time_budget", type=float, default=None, help="Seconds per pair before falling back to an approximate score")
+    parser.add_argument("--max_nodes", type=int, default=None, help="Tables with more nodes than this get an approximate score without running the exact DP")
+    parser.add_argument("--per_file_csv", type=str, default=None, help="Output CSV with one row per file (scores, node counts, errors, stage timings)")
+    parser.add_argument("--profile", action="store_true", help="Print stage timings, time by table size and the slowest files")
+    parser.add_argument("--top_n", type=int, default=10, help="Slowest files listed by --profile")
     args = parser.parse_args()
+    args.pred_path = expand_paths(args.pred_path)
+    if len(args.pred_path) > 1 and args.stream:
+        parser.error("--stream takes a single --pred_path")
     main(args)
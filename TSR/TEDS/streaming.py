@@ -0,0 +1,173 @@
+import codecs
+import gzip
+import json
+import re
+import shutil
+import tempfile
+from array import array
+
+from evaluate import gt_table, pred_table
+
+# Bounded-memory access to large prediction / ground-truth JSON files.
+# A file is read once in chunks to record where each entry lives (byte
+# offset and length, keyed by filename); entries are then decoded one at a
+# time on demand. Gzip input is decompressed once into an anonymous temp
+# file during that pass so later lookups are plain seeks.
+
+_CHUNK = 1 << 20
+_NON_WHITESPACE = re.compile(r"\S")
+_DECODER = json.JSONDecoder()
+
+
+class _JsonStream:
+    def __init__(self, source):
+        self.source = source
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.byte_pos = 0  # byte offset of buf[pos] in the file
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.source.read(_CHUNK)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+
+    def _advance(self, end):
+        self.byte_pos += len(self.buf[self.pos:end].encode("utf-8"))
+        self.pos = end
+
+    def peek(self):
+        while True:
+            match = _NON_WHITESPACE.search(self.buf, self.pos)
+            if match:
+                self._advance(match.start())
+                return self.buf[self.pos]
+            self._advance(len(self.buf))
+            if self.eof:
+                return ""
+            self._fill()
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at byte {self.byte_pos}, found {found!r}")
+        self._advance(self.pos + 1)
+
+    def value(self):
+        # Returns (value, byte offset, byte length) of the next JSON value.
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+                # A number could continue in the next chunk.
+                if end < len(self.buf) or self.eof:
+                    break
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+        start = self.byte_pos
+        self._advance(end)
+        return value, start, self.byte_pos - start
+
+
+def iter_entries(stream):
+    # Yields (entry, offset, length) from a top-level list, or from the
+    # "image" list of a wrapped ground-truth file (see unwrap_ground_truth).
+    if stream.peek() == "{":
+        stream.expect("{")
+        while True:
+            key, _, _ = stream.value()
+            stream.expect(":")
+            if key == "image":
+                break
+            stream.value()
+            if stream.peek() != ",":
+                raise ValueError('Expected a list or an object with an "image" list')
+            stream.expect(",")
+
+    stream.expect("[")
+    if stream.peek() == "]":
+        return
+    while True:
+        yield stream.value()
+        char = stream.peek()
+        stream.expect(char)
+        if char == "]":
+            return
+        if char != ",":
+            raise ValueError(f"Unexpected {char!r} in JSON list at byte {stream.byte_pos}")
+
+
+class JsonArrayIndex:
+    # filename -> location of its entry; index[filename] decodes the entry
+    # and returns read(entry). Entries without a filename are skipped, as are
+    # those read maps to None when skip_missing is set (GT entries without a
+    # table, as in evaluate.build_gt_dict). Later duplicates win, as in a dict.
+    def __init__(self, path, read, skip_missing=False):
+        self.read = read
+        self.slots = {}
+        self.offsets = array("q")
+        self.lengths = array("q")
+
+        if path.endswith(".gz"):
+            self.file = tempfile.TemporaryFile()
+            with gzip.open(path, "rb") as source:
+                shutil.copyfileobj(source, self.file)
+            self.file.seek(0)
+        else:
+            self.file = open(path, "rb")
+
+        for entry, offset, length in iter_entries(_JsonStream(self.file)):
+            filename = entry.get("filename")
+            if not filename:
+                continue
+            if skip_missing and read(entry) is None:
+                continue
+            slot = self.slots.get(filename)
+            if slot is None:
+                self.slots[filename] = len(self.offsets)
+                self.offsets.append(offset)
+                self.lengths.append(length)
+            else:
+                self.offsets[slot] = offset
+                self.lengths[slot] = length
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, filename):
+        return filename in self.slots
+
+    def keys(self):
+        return self.slots.keys()
+
+    def __getitem__(self, filename):
+        slot = self.slots[filename]
+        self.file.seek(self.offsets[slot])
+        return self.read(json.loads(self.file.read(self.lengths[slot]).decode("utf-8")))
+
+    def close(self):
+        self.file.close()
+
+
+def stream_pairs(pred_path, gt_path, pred_format="html", gt_format="html"):
+    # Returns the sorted matched filenames and a generator of
+    # (filename, pred_table, gt_table) that reads each pair only when pulled.
+    # Tables are read as evaluate.build_dicts reads them: converted from
+    # another format when needed, None for a prediction without a table.
+    pred_index = JsonArrayIndex(pred_path, lambda entry: pred_table(entry, pred_format))
+    gt_index = JsonArrayIndex(gt_path, lambda entry: gt_table(entry, gt_format), skip_missing=True)
+    matched_files = sorted(set(pred_index.keys()) & set(gt_index.keys()))
+
+    def pairs():
+        try:
+            for fname in matched_files:
+                yield fname, pred_index[fname], gt_index[fname]
+        finally:
+            pred_index.close()
+            gt_index.close()
+
+    return matched_files, pairs()
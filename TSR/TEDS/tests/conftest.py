@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The TEDS modules are flat and import each other by name, as when run
+# from TSR/TEDS; table_codec is imported from the repository root.
+TEDS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TEDS_DIR)
+sys.path.insert(1, os.path.dirname(os.path.dirname(TEDS_DIR)))
@@ -0,0 +1,89 @@
+from tree_distance import CompactTree, intern_label
+
+# Trees for the distance tests, written as (label, [children]) tuples (zss
+# reads them as such) and converted to CompactTree by to_tree().
+
+
+def random_tree(rng, size, labels="abcd"):
+    nodes = [(rng.choice(labels), [])]
+    for _ in range(size - 1):
+        node = (rng.choice(labels), [])
+        rng.choice(nodes)[1].append(node)
+        nodes.append(node)
+    return nodes[0]
+
+
+def random_table(rng, rows, cols, texts=6):
+    # table > tr > td:<text>, the content tree of an HTML table.
+    return ("table", [("tr", [(f"td:{rng.randrange(texts)}", []) for _ in range(cols)]) for _ in range(rows)])
+
+
+def perturb_table(rng, table, edits, texts=6):
+    # A copy of table with edits random cell/row insertions, deletions and
+    # relabels.
+    rows = [list(cells) for _, cells in table[1]]
+    for _ in range(edits):
+        edit = rng.choice(("relabel", "insert", "delete", "insert_row", "delete_row"))
+        r = rng.randrange(len(rows)) if rows else None
+        if edit == "insert_row" or r is None:
+            rows.insert(rng.randrange(len(rows) + 1), [(f"td:{rng.randrange(texts)}", [])])
+        elif edit == "delete_row":
+            del rows[r]
+        elif edit == "insert":
+            rows[r].insert(rng.randrange(len(rows[r]) + 1), (f"td:{rng.randrange(texts)}", []))
+        elif rows[r]:
+            c = rng.randrange(len(rows[r]))
+            if edit == "delete":
+                del rows[r][c]
+            else:
+                rows[r][c] = (f"td:{rng.randrange(texts)}", [])
+    return ("table", [("tr", cells) for cells in rows])
+
+
+def random_otsl(rng, rows, cols, texts=("a", "b c", "1.5", "")):
+    # OTSL of a rows x cols grid with random spans (lcel/ucel/xcel) and
+    # empty, header and section cells.
+    owner = [[None] * cols for _ in range(rows)]
+    tokens = []
+    for r in range(rows):
+        for c in range(cols):
+            if owner[r][c] is not None:
+                r0, c0 = owner[r][c]
+                tokens.append("<xcel>" if r > r0 and c > c0 else "<ucel>" if r > r0 else "<lcel>")
+                continue
+            width = height = 1
+            if rng.random() < 0.3:
+                while c + width < cols and owner[r][c + width] is None and rng.random() < 0.6:
+                    width += 1
+                while r + height < rows and all(owner[r + height][c + k] is None for k in range(width)) \
+                        and rng.random() < 0.6:
+                    height += 1
+            for i in range(r, r + height):
+                for j in range(c, c + width):
+                    owner[i][j] = (r, c)
+            token = rng.choice(("fcel", "fcel", "fcel", "ecel", "ched", "rhed", "srow"))
+            tokens.append(f"<{token}>" + ("" if token == "ecel" else rng.choice(texts)))
+        tokens.append("<nl>")
+    return "".join(tokens)
+
+
+def to_html(table):
+    # The HTML a table tuple is the content tree of.
+    rows = "".join("<tr>" + "".join(f"<td>{label[3:]}</td>" for label, _ in cells) + "</tr>" for _, cells in table[1])
+    return f"<html><body><table>{rows}</table></body></html>"
+
+
+def to_tree(tree):
+    # Postorder labels; a node's leftmost leaf is the first node of its
+    # subtree in postorder.
+    labels, lmds = [], []
+    stack = [(tree, False, 0)]
+    while stack:
+        node, done, first = stack.pop()
+        if done:
+            lmds.append(first)
+            labels.append(intern_label(node[0]))
+            continue
+        stack.append((node, True, len(labels)))
+        stack.extend((child, False, 0) for child in reversed(node[1]))
+    return CompactTree(labels, lmds)
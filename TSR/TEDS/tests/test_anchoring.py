@@ -0,0 +1,113 @@
+import random
+import time
+
+import pytest
+
+import tree_distance
+from random_trees import perturb_table, random_table, random_tree, to_tree
+from tree_distance import (
+    _sequence_distance, anchored_edit_distance, distance_bounds, strip_common, traversal_bound, tree_edit_distance
+)
+
+# Anchoring must give exactly tree_edit_distance: strip_common drops rows
+# that map to each other, anchored_edit_distance splits at identical middle
+# rows and falls back to the full distance when the summed segments do not
+# meet a lower bound.
+
+
+def table(rows):
+    return ("table", [("tr", [(f"td:{text}", []) for text in row]) for row in rows])
+
+
+def recording(calls):
+    def distance(a, b):
+        calls.append((len(a), len(b)))
+        return tree_edit_distance(a, b)
+    return distance
+
+
+def middle_anchored(first, last):
+    # Rows 1 and 8 differ (first, last); rows 0 and 9 are stripped, rows 2-7
+    # are the middle anchor.
+    body = [[f"{r}.{c}" for c in range(5)] for r in range(10)]
+    a, b = [list(row) for row in body], [list(row) for row in body]
+    b[1], b[8] = first, last
+    return to_tree(table(a)), to_tree(table(b))
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_perturbed_tables(seed, monkeypatch):
+    # Anchor even small pairs, so every perturbation goes through it.
+    monkeypatch.setattr(tree_distance, "ANCHOR_MIN_CELLS", 0)
+    rng = random.Random(seed)
+    for _ in range(100):
+        # Few distinct texts, so identical rows appear anywhere.
+        base = random_table(rng, rng.randint(2, 12), rng.randint(1, 4), texts=3)
+        a, b = to_tree(base), to_tree(perturb_table(rng, base, rng.randint(0, 5), texts=3))
+        expected = tree_edit_distance(a, b)
+        assert tree_edit_distance(*strip_common(a, b)) == expected
+        assert anchored_edit_distance(a, b, tree_edit_distance) == expected
+        assert anchored_edit_distance(b, a, tree_edit_distance) == expected
+
+
+def test_middle_anchor():
+    # New texts in rows 1 and 8: the segments sum to the lower bound, so
+    # only the two segments are computed, each stripped down to the
+    # differing cell under its root.
+    a, b = middle_anchored(["x", "1.1", "1.2", "1.3", "1.4"], ["8.0", "8.1", "y", "8.3", "8.4"])
+    stripped = strip_common(a, b)
+    assert len(stripped[0]) == len(a) - 12
+    calls = []
+    assert anchored_edit_distance(a, b, recording(calls)) == tree_edit_distance(a, b) == 2
+    assert calls == [(2, 2), (2, 2)]
+
+
+def test_fallback_above_lower_bound(monkeypatch):
+    # Row 0 of a is row 1 of b, but the distance maps row i to row i (2 + 2):
+    # the segments around the anchor (2 + 4) exceed both lower bounds, so
+    # the full pair is computed.
+    monkeypatch.setattr(tree_distance, "ANCHOR_MIN_CELLS", 0)
+    a, b = to_tree(table([["2", "2", "2"], ["0", "2", "0"]])), to_tree(table([["2"], ["2", "2", "2"]]))
+    assert max(distance_bounds(a, b)[0], traversal_bound(a, b)) < 6
+    calls = []
+    assert anchored_edit_distance(a, b, recording(calls)) == tree_edit_distance(a, b) == 4
+    assert calls[-1] == (len(a), len(b))
+
+
+@pytest.mark.parametrize("texts", [None, "x"])
+def test_moved_cell(texts):
+    # Row 10 of a 1321-node table loses a cell and row 100 gains one: the
+    # label multisets do not show that this costs 2, the label sequences do.
+    # With texts="x" all rows but those two are identical, so only the
+    # positional anchors give segments summing to 2.
+    rows = [[texts or f"{r}.{c}" for c in range(10)] for r in range(120)]
+    changed = [list(row) for row in rows]
+    changed[10].pop()
+    changed[100].append("y")
+    a, b = to_tree(table(rows)), to_tree(table(changed))
+    assert len(a) == 1321
+    calls = []
+    start = time.perf_counter()
+    assert anchored_edit_distance(a, b, recording(calls)) == 2
+    assert time.perf_counter() - start < 0.5
+    # At most two rows (and the root) per call, never the whole pair.
+    assert max(max(call) for call in calls) <= 2 * 11 + 1
+
+
+def test_traversal_bound():
+    def levenshtein(a, b):
+        row = list(range(len(b) + 1))
+        for i, x in enumerate(a, 1):
+            previous, row[0] = row[0], i
+            for j, y in enumerate(b, 1):
+                previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (x != y))
+        return row[-1]
+
+    rng = random.Random(0)
+    for _ in range(300):
+        a = [rng.randint(0, 3) for _ in range(rng.randint(0, 90))]
+        b = [rng.randint(0, 3) for _ in range(rng.randint(0, 90))]
+        assert _sequence_distance(a, b) == levenshtein(a, b)
+    for _ in range(200):
+        a, b = to_tree(random_tree(rng, rng.randint(1, 25))), to_tree(random_tree(rng, rng.randint(1, 25), "ab"))
+        assert traversal_bound(a, b) <= tree_edit_distance(a, b)
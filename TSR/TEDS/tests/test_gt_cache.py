@@ -0,0 +1,125 @@
+import json
+import os
+import random
+
+import numpy as np
+
+import gt_cache
+from gt_cache import GTCache, compile_tree
+from random_trees import random_table, to_html
+from tree_distance import label_name
+
+# Trees read back from the cache must be the ones compile_tree builds, after
+# appends in several flushes, reloads, edited tables and compaction.
+
+
+def gt_tables(seed, count):
+    rng = random.Random(seed)
+    tables = {f"t{i}.png": to_html(random_table(rng, rng.randint(1, 6), rng.randint(1, 5), texts=50))
+              for i in range(count)}
+    # Not a table: cached as None.
+    tables["broken.png"] = "no table here"
+    return tables
+
+
+def assert_trees(cache, tables, hits):
+    before = cache.hits
+    for filename, html in tables.items():
+        tree, expected = cache.get_tree(filename, html), compile_tree(html)
+        if expected is None:
+            assert tree is None
+            continue
+        for name in ("labels", "content_labels", "lmds"):
+            assert np.array_equal(getattr(tree, name), getattr(expected, name))
+    assert cache.hits - before == hits
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "cache")
+    tables = gt_tables(0, 30)
+    cache = GTCache(path)
+    names = list(tables)
+    # Appended in three flushes, as evaluate_pairs does batch by batch.
+    for start in range(0, len(names), 12):
+        for filename in names[start:start + 12]:
+            cache.get_tree(filename, tables[filename])
+        cache.flush()
+    assert cache.misses == len(tables)
+    assert_trees(cache, tables, len(tables))
+    assert_trees(GTCache(path), tables, len(tables))
+
+
+def test_stale_digest(tmp_path):
+    path = str(tmp_path / "cache")
+    tables = gt_tables(1, 10)
+    GTCache(path).compile(tables)
+    edited = dict(tables, **{"t3.png": to_html(("table", [("tr", [("td:edited", [])])]))})
+    cache = GTCache(path)
+    assert_trees(cache, edited, len(tables) - 1)
+    cache.flush()
+    assert_trees(GTCache(path), edited, len(tables))
+    # The old HTML is no longer cached.
+    assert_trees(GTCache(path), tables, len(tables) - 1)
+
+
+def test_version_mismatch(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache")
+    tables = gt_tables(2, 10)
+    GTCache(path).compile(tables)
+    monkeypatch.setattr(gt_cache, "CACHE_VERSION", gt_cache.CACHE_VERSION + 1)
+    cache = GTCache(path)
+    assert not cache.entries
+    # Rebuilt from scratch in the new version.
+    cache.compile(tables)
+    assert len(open(os.path.join(path, "entries.jsonl")).readlines()) == len(tables)
+    assert_trees(GTCache(path), tables, len(tables))
+
+
+def test_interrupted_flush(tmp_path):
+    path = str(tmp_path / "cache")
+    tables = gt_tables(3, 10)
+    GTCache(path).compile(tables)
+    # A flush cut short: array data and half an entry line no entry covers.
+    with open(os.path.join(path, "lmds.bin"), "ab") as f:
+        f.write(b"\0" * 12)
+    with open(os.path.join(path, "entries.jsonl"), "ab") as f:
+        f.write(b'["t0.png", "')
+    more = gt_tables(4, 5)
+    more = {f"more_{filename}": html for filename, html in more.items()}
+    cache = GTCache(path)
+    cache.compile(more)
+    assert_trees(GTCache(path), dict(tables, **more), len(tables) + len(more))
+
+
+def test_compact(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache")
+    tables = gt_tables(5, 20)
+    GTCache(path).compile(tables)
+    size = os.path.getsize(os.path.join(path, "lmds.bin"))
+    # Recompile a third of the tables: too few stale nodes to compact on load.
+    edited = dict(tables)
+    for filename in list(tables)[:7]:
+        edited[filename] = to_html(("table", [("tr", [(f"td:{filename}", [])] * 3)]))
+    GTCache(path).compile(edited)
+    cache = GTCache(path)
+    assert 0 < cache.stale_nodes() < gt_cache.COMPACT_STALE * len(cache.arrays["lmds"])
+    monkeypatch.setattr(gt_cache, "_COPY_CHUNK", 5)
+    cache.compact()
+    assert cache.stale_nodes() == 0
+    assert_trees(cache, edited, len(edited))
+    assert_trees(GTCache(path), edited, len(edited))
+    # Only the labels of the live trees are kept.
+    used = set()
+    for tree in filter(None, map(compile_tree, edited.values())):
+        used.update(map(label_name, np.concatenate([tree.labels, tree.content_labels]).tolist()))
+    with open(os.path.join(path, "labels.jsonl"), encoding="utf-8") as f:
+        assert sorted(json.loads(line) for line in f) == sorted(used)
+
+    # Most tables recompiled: the next load compacts by itself.
+    for filename in tables:
+        edited[filename] = to_html(("table", [("tr", [("td:new", [])])]))
+    GTCache(path).compile(edited)
+    cache = GTCache(path)
+    assert cache.stale_nodes() == 0
+    assert os.path.getsize(os.path.join(path, "lmds.bin")) < size
+    assert_trees(cache, edited, len(edited))
@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+from metric import TEDS
+from random_trees import perturb_table, random_table, to_html
+
+# The batch methods must score like evaluate(), whatever the job count and
+# kernel; n_jobs=0 runs in-process like n_jobs=1.
+
+
+def html_pairs(seed, count):
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        gt = random_table(rng, rng.randint(1, 8), rng.randint(1, 5))
+        pairs.append((to_html(perturb_table(rng, gt, rng.randint(0, 4))), to_html(gt)))
+    return pairs
+
+
+@pytest.mark.parametrize("kernel", ["scalar", "batched"])
+@pytest.mark.parametrize("n_jobs", [0, 1, 2])
+def test_batch_evaluate(n_jobs, kernel):
+    pairs = html_pairs(0, 40)
+    reference = TEDS()
+    teds = TEDS(n_jobs=n_jobs, kernel=kernel)
+    assert teds.n_jobs == max(1, n_jobs)
+    for is_structure in (True, False):
+        expected = [reference.evaluate(pred, gt, is_structure) for pred, gt in pairs]
+        assert teds.batch_evaluate(pairs, is_structure) == expected
+    assert teds.batch_evaluate_both(pairs) == [reference.evaluate_both(pred, gt) for pred, gt in pairs]
@@ -0,0 +1,65 @@
+import random
+import re
+
+import result_cache
+from evaluate import evaluate_pairs
+from random_trees import perturb_table, random_table, to_html
+from result_cache import ResultCache, result_key
+
+# Reruns must take every scored pair from the cache and only those: pairs
+# without a prediction table are failed files, neither looked up nor counted.
+
+
+def test_result_key_whitespace(monkeypatch):
+    pred, gt = "<table><tr><td>a b</td></tr></table>", "<table><tr><td>c</td></tr></table>"
+    key = result_key(pred, gt, "both")
+    assert result_key(" <table><tr><td>a \n\t b</td></tr></table>\n", gt, "both") == key
+    assert result_key(pred, gt.replace("<td>", "<td>  "), "both") == result_key(pred, gt.replace("<td>", "<td> "), "both")
+    assert result_key(pred.replace("a b", "ab"), gt, "both") != key
+    assert result_key(gt, pred, "both") != key
+    assert result_key(pred, gt, "both:levenshtein") != key
+    monkeypatch.setattr(result_cache, "RESULT_VERSION", result_cache.RESULT_VERSION + 1)
+    assert result_key(pred, gt, "both") != key
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.db"), max_entries=3)
+    cache.put_many([(key, {"teds": i}) for i, key in enumerate("abc")])
+    assert cache.get_many(["a", "x"]) == {"a": {"teds": 0}}
+    cache.put_many([("d", {"teds": 3})])
+    # b, the least recently used, is evicted.
+    assert set(cache.get_many(list("abcd"))) == {"a", "c", "d"}
+    assert (cache.hits, cache.misses) == (4, 2)
+    cache.close()
+
+
+def run(pairs, path, capsys):
+    records = evaluate_pairs([fname for fname, _, _ in pairs], pairs, result_cache=path)
+    hits, misses = map(int, re.search(r"Result cache: (\d+) hits, (\d+) misses", capsys.readouterr().out).groups())
+    return records, hits, misses
+
+
+def test_hits_and_misses(tmp_path, capsys):
+    rng = random.Random(0)
+    pairs = []
+    for i in range(12):
+        gt = random_table(rng, rng.randint(1, 5), rng.randint(1, 4))
+        pairs.append((f"f{i}.png", to_html(perturb_table(rng, gt, rng.randint(0, 3))), to_html(gt)))
+    pairs += [("none.png", None, to_html(gt)), ("empty.png", "", to_html(gt))]
+    path = str(tmp_path / "results.db")
+
+    first, hits, misses = run(pairs, path, capsys)
+    assert (hits, misses) == (0, 13)
+    assert not any(record["cached"] for record in first)
+    assert first[-2]["error"] == "prediction has no table"
+
+    again, hits, misses = run(pairs, path, capsys)
+    assert (hits, misses) == (13, 0)
+    assert [record["cached"] for record in again] == [True] * 12 + [False, True]
+    for before, after in zip(first, again):
+        assert (before["teds"], before["ted"], before["error"]) == (after["teds"], after["ted"], after["error"])
+
+    # Reindented files still hit.
+    spaced = [(fname, pred and f"\n  {pred}\n", f"{gt}\n") for fname, pred, gt in pairs]
+    _, hits, misses = run(spaced, path, capsys)
+    assert (hits, misses) == (13, 0)
@@ -0,0 +1,85 @@
+import gzip
+import json
+
+import pytest
+
+import streaming
+from evaluate import build_gt_dict, build_pred_dict, match_dicts
+from streaming import JsonArrayIndex, stream_pairs
+
+# The index must find every entry whatever the chunk boundaries (values are
+# split across _fill calls), and stream_pairs must yield exactly the pairs of
+# build_pred_dict / build_gt_dict.
+
+ENTRIES = [
+    {"filename": "a.png", "html": "<table><tr><td>café µm</td></tr></table>", "score": 12345.678e-3},
+    {"filename": "b.png", "html": "<table><tr><td>\"quoted\" \\ back\nslash 😀</td></tr></table>",
+     "meta": {"nested": [1, {"deep": [2.5, -7, None, True]}], "text": "}],{"}},
+    {"filename": "c.png", "html": None},
+    {"filename": "d.png"},
+    {"html": "<table><tr><td>no filename</td></tr></table>"},
+    {"filename": "e.png", "otsl": "<fcel>x<lcel><nl><fcel>1<fcel>2<nl>"},
+    {"filename": "f.png", "html": ""},
+    {"filename": "a.png", "html": "<table><tr><td>later duplicate</td></tr></table>", "n": 100000000000000000000},
+]
+
+GT_ENTRIES = [
+    {"filename": "a.png", "text_html_table": "<table><tr><td>gt é</td></tr></table>"},
+    {"filename": "b.png", "text_html_table": "<table><tr><td>gt b</td></tr></table>"},
+    {"filename": "c.png", "text_html_table": "<table><tr><td>gt c</td></tr></table>"},
+    {"filename": "d.png", "text_html_table": "<table><tr><td>gt d</td></tr></table>"},
+    {"filename": "e.png", "otsl": "<fcel>x<lcel><nl><fcel>1<fcel>2<nl>"},
+    {"filename": "f.png", "text_html_table": "<table><tr><td>gt f</td></tr></table>"},
+    {"filename": "g.png", "text_html_table": ""},
+    {"filename": "b.png", "text_html_table": None},
+]
+
+
+def write(path, data, indent=None):
+    text = json.dumps(data, indent=indent, ensure_ascii=False)
+    if str(path).endswith(".gz"):
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 7, 64, 1 << 20])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_chunk_boundaries(tmp_path, monkeypatch, chunk, indent):
+    monkeypatch.setattr(streaming, "_CHUNK", chunk)
+    path = write(tmp_path / "pred.json", ENTRIES, indent)
+    index = JsonArrayIndex(path, lambda entry: entry)
+    expected = {entry["filename"]: entry for entry in ENTRIES if entry.get("filename")}
+    assert sorted(index.keys()) == sorted(expected)
+    for fname, entry in expected.items():
+        assert index[fname] == entry
+    index.close()
+
+
+@pytest.mark.parametrize("suffix", [".json", ".json.gz"])
+@pytest.mark.parametrize("wrapped", [False, True])
+def test_stream_pairs_match_build_dicts(tmp_path, monkeypatch, suffix, wrapped):
+    monkeypatch.setattr(streaming, "_CHUNK", 5)
+    gt = {"info": {"image": "not this one"}, "version": 2, "image": GT_ENTRIES} if wrapped else GT_ENTRIES
+    pred_path = write(tmp_path / ("pred" + suffix), ENTRIES)
+    gt_path = write(tmp_path / ("gt" + suffix), gt)
+    for pred_format, gt_format in [("html", "html"), ("otsl", "otsl"), ("html", "otsl")]:
+        expected_files, expected_pairs = match_dicts(
+            build_pred_dict(ENTRIES, pred_format), build_gt_dict(GT_ENTRIES, gt_format)
+        )
+        matched_files, pairs = stream_pairs(pred_path, gt_path, pred_format, gt_format)
+        assert matched_files == expected_files
+        assert list(pairs) == list(expected_pairs)
+
+
+def test_missing_tables(tmp_path):
+    matched_files, pairs = stream_pairs(write(tmp_path / "pred.json", ENTRIES), write(tmp_path / "gt.json", GT_ENTRIES))
+    pairs = {fname: (pred, gt) for fname, pred, gt in pairs}
+    # Predictions without a table are kept as None (failed files), a GT
+    # entry without one is dropped unless an earlier duplicate had one.
+    assert pairs["c.png"][0] is None and pairs["d.png"][0] is None
+    assert pairs["b.png"][1] == "<table><tr><td>gt b</td></tr></table>"
+    assert pairs["a.png"][0] == ENTRIES[-1]["html"]
+    assert "g.png" not in pairs
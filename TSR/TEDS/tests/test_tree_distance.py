@@ -0,0 +1,168 @@
+import random
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+import metric
+import otsl
+import tree_distance
+from random_trees import perturb_table, random_otsl, random_table, random_tree, to_tree
+from tree_distance import (
+    BudgetExceeded, CompactTree, _zhang_shasha, batch_tree_edit_distance, grid_distance, grid_rows, intern_label,
+    same_shape_distance, tree_edit_distance
+)
+from utils import html_to_tree
+
+# tree_edit_distance replaces zss.simple_distance (unit costs); both must
+# agree on every pair. The grid row DP and the same-shape count must agree
+# with tree_edit_distance, and OTSL must give the trees of its HTML.
+
+
+def zss_distance(a, b):
+    zss = pytest.importorskip("zss")
+    return zss.simple_distance(a, b, get_children=lambda node: node[1], get_label=lambda node: node[0])
+
+
+def random_pairs(seed, count, max_size):
+    rng = random.Random(seed)
+    return [(random_tree(rng, rng.randint(1, max_size)), random_tree(rng, rng.randint(1, max_size))) for _ in range(count)]
+
+
+def table_pairs(seed, count):
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        table = random_table(rng, rng.randint(1, 8), rng.randint(1, 6))
+        pairs.append((table, perturb_table(rng, table, rng.randint(0, 6))))
+    return pairs
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_random_trees(seed):
+    for a, b in random_pairs(seed, 200, 25):
+        assert tree_edit_distance(to_tree(a), to_tree(b)) == zss_distance(a, b)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_table_trees(seed):
+    for a, b in table_pairs(seed, 50):
+        assert tree_edit_distance(to_tree(a), to_tree(b)) == zss_distance(a, b)
+        assert tree_edit_distance(to_tree(b), to_tree(a)) == zss_distance(b, a)
+
+
+def test_single_nodes():
+    assert tree_edit_distance(to_tree(("a", [])), to_tree(("a", []))) == 0
+    assert tree_edit_distance(to_tree(("a", [])), to_tree(("b", []))) == 1
+
+
+def test_batch_kernel():
+    pairs = random_pairs(10, 200, 25) + table_pairs(11, 50)
+    expected = [zss_distance(a, b) for a, b in pairs]
+    assert batch_tree_edit_distance([(to_tree(a), to_tree(b)) for a, b in pairs]) == expected
+
+
+def relabelled(rng, tree, labels):
+    # tree with a few node labels replaced by random ones of labels.
+    new = tree.labels.copy()
+    for v in rng.sample(range(len(new)), rng.randint(0, min(4, len(new)))):
+        new[v] = intern_label(rng.choice(labels))
+    return CompactTree(new, tree.lmds)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_same_shape_distance(seed):
+    rng = random.Random(seed)
+    counted = 0
+    for _ in range(300):
+        if rng.random() < 0.5:
+            a = to_tree(random_tree(rng, rng.randint(1, 30)))
+            b = relabelled(rng, a, "abcdxy")
+        else:
+            # Content trees of a table with a few cell texts changed.
+            a = to_tree(random_table(rng, rng.randint(1, 6), rng.randint(1, 5)))
+            b = relabelled(rng, a, [f"td:{text}" for text in range(8)])
+        dist = same_shape_distance(a, b)
+        if dist is not None:
+            assert dist == tree_edit_distance(a, b)
+            counted += 1
+        else:
+            # Only when a label removed somewhere is added elsewhere.
+            differ = a.labels != b.labels
+            assert set(a.labels[differ].tolist()) & set(b.labels[differ].tolist())
+    assert counted > 200
+
+
+def test_same_shape_distance_other_shapes():
+    rng = random.Random(0)
+    for _ in range(200):
+        size = rng.randint(2, 12)
+        a, b = to_tree(random_tree(rng, size)), to_tree(random_tree(rng, size))
+        if not np.array_equal(a.lmds, b.lmds):
+            assert same_shape_distance(a, b) is None
+            # Even with the same labels.
+            assert same_shape_distance(a, CompactTree(a.labels, b.lmds)) is None
+    assert same_shape_distance(to_tree(("a", [])), to_tree(("a", [("a", [])]))) is None
+
+
+def structure(table):
+    # The structure tree of a table tuple: every cell a plain td.
+    return to_tree(("table", [("tr", [("td", []) for _ in cells]) for _, cells in table[1]]))
+
+
+def grid_pair(seed):
+    # Two 30-row tables a few edits apart, without empty rows.
+    rng = random.Random(seed)
+    table = random_table(rng, 30, 6)
+    return structure(table), structure(perturb_table(rng, table, 6))
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_grid_distance(seed):
+    for a, b in table_pairs(20 + seed, 100):
+        sizes = [len(cells) for _, cells in a[1]], [len(cells) for _, cells in b[1]]
+        a, b = structure(a), structure(b)
+        if not all(sizes[0]) or not all(sizes[1]) or not sizes[0] or not sizes[1]:
+            # A table without rows or with an empty row is not a grid tree.
+            assert grid_distance(a, b) is None
+            continue
+        assert grid_rows(a).tolist() == sizes[0] and grid_rows(b).tolist() == sizes[1]
+        expected = _zhang_shasha(
+            a.labels.tolist(), a.lmds.tolist(), a.keyroots.tolist(),
+            b.labels.tolist(), b.lmds.tolist(), b.keyroots.tolist()
+        )
+        assert grid_distance(a, b) == tree_edit_distance(a, b) == expected
+
+
+def test_grid_distance_fallback(monkeypatch):
+    a, b = grid_pair(0)
+    expected = tree_edit_distance(a, b)
+    assert grid_distance(a, b) == expected > 0
+    with pytest.raises(BudgetExceeded):
+        grid_distance(a, b, deadline=time.perf_counter() - 1)
+    # Over GRID_MAX_CELLS, TEDS takes the DP and scores the same.
+    monkeypatch.setattr(tree_distance, "GRID_MAX_CELLS", 0)
+    monkeypatch.setattr(metric, "_STRUCTURE_MEMO", OrderedDict())
+    assert grid_distance(a, b) is None
+    assert metric.TEDS().evaluate(a, b) == 1 - expected / len(b)
+
+
+def test_otsl_trees(monkeypatch):
+    pytest.importorskip("table_codec")
+    rng = random.Random(0)
+    for _ in range(300):
+        table = random_otsl(rng, rng.randint(1, 6), rng.randint(1, 6))
+        html = otsl.otsl_to_html(table)
+        for structure_only in (True, False):
+            expected = html_to_tree(html, structure_only, clean=True)
+            trees = [otsl.otsl_to_tree(table, structure_only)]
+            # Without table_codec, the token scan.
+            with monkeypatch.context() as patch:
+                patch.setattr(otsl, "parse_otsl", None)
+                trees.append(otsl.otsl_to_tree(table, structure_only))
+            for tree in trees:
+                assert np.array_equal(tree.labels, expected.labels)
+                assert np.array_equal(tree.lmds, expected.lmds)
+                if not structure_only:
+                    assert np.array_equal(tree.content_labels, expected.content_labels)
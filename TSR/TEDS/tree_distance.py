@@ -0,0 +1,734 @@
+import hashlib
+import time
+from collections import Counter
+from difflib import SequenceMatcher
+
+import numpy as np
+
+# Tree edit distance with unit costs (insert = delete = 1, relabel = 0/1),
+# equivalent to zss.simple_distance with its default label distance.
+#
+# Trees are stored as postorder arrays of interned integer labels,
+# leftmost-leaf indices and keyroots (CompactTree). For every pair the
+# cheaper of the two Zhang-Shasha decompositions (left paths, or right paths
+# via the mirrored trees) is chosen up front, which is the path strategy
+# RTED/APTED picks between for flat, wide trees such as HTML tables.
+
+class BudgetExceeded(Exception):
+    pass
+
+
+_LABEL_IDS = {}
+_LABELS = []
+
+
+def intern_label(label):
+    label_id = _LABEL_IDS.get(label)
+    if label_id is None:
+        label_id = _LABEL_IDS[label] = len(_LABELS)
+        _LABELS.append(label)
+    return label_id
+
+
+def label_name(label_id):
+    return _LABELS[label_id]
+
+
+def export_labels(arrays):
+    # Label ids are only meaningful inside this process. Rewrites the arrays
+    # as indices into a returned table of label strings, for pickling/saving.
+    arrays = list(arrays)
+    ids, inverse = np.unique(np.concatenate(arrays or [np.empty(0, np.int32)]), return_inverse=True)
+    splits = np.cumsum([len(a) for a in arrays])[:-1]
+    local = [part.astype(np.int32) for part in np.split(inverse, splits)]
+    return [_LABELS[i] for i in ids.tolist()], local
+
+
+def import_labels(strings):
+    # Inverse of export_labels: returns a lookup array, table index -> label id.
+    return np.array([intern_label(label) for label in strings], dtype=np.int32)
+
+
+def _keyroots(lmds):
+    # A node is a keyroot iff no later node in postorder shares its lmd.
+    n = len(lmds)
+    _, last = np.unique(lmds[::-1], return_index=True)
+    return np.sort(n - 1 - last).astype(np.int32)
+
+
+class CompactTree:
+    # content_labels, when present, is a second labelling of the same shape
+    # (td nodes labelled "td:<text>") so one parse serves both TEDS and TED.
+    __slots__ = ("labels", "lmds", "keyroots", "content_labels", "_mirror", "_hash")
+
+    def __init__(self, labels, lmds, content_labels=None, keyroots=None):
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.lmds = np.asarray(lmds, dtype=np.int32)
+        self.keyroots = _keyroots(self.lmds) if keyroots is None else keyroots
+        self.content_labels = None if content_labels is None else np.asarray(content_labels, dtype=np.int32)
+        self._mirror = None
+        self._hash = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getstate__(self):
+        arrays = [self.labels] if self.content_labels is None else [self.labels, self.content_labels]
+        strings, local = export_labels(arrays)
+        return strings, local, self.lmds, self.keyroots
+
+    def __setstate__(self, state):
+        strings, local, lmds, keyroots = state
+        remap = import_labels(strings)
+        self.labels = remap[local[0]]
+        self.content_labels = remap[local[1]] if len(local) > 1 else None
+        self.lmds = lmds
+        self.keyroots = keyroots
+        self._mirror = None
+        self._hash = None
+
+    def structure_hash(self):
+        # Digest of the tag skeleton (structural labels and shape); equal for
+        # trees of identical structure within this process.
+        if self._hash is None:
+            digest = hashlib.blake2b(self.labels.tobytes(), digest_size=16)
+            digest.update(self.lmds.astype(np.int32).tobytes())
+            self._hash = digest.digest()
+        return self._hash
+
+    def content(self):
+        return CompactTree(self.content_labels, self.lmds, keyroots=self.keyroots)
+
+    def children(self):
+        # Child lists in left-to-right order, recovered from the lmds.
+        lmds = self.lmds.tolist()
+        children = [[] for _ in lmds]
+        for v, lmd in enumerate(lmds):
+            c = v - 1
+            while c >= lmd:
+                children[v].append(c)
+                c = lmds[c] - 1
+            children[v].reverse()
+        return children
+
+    def strategy_cost(self):
+        return int((self.keyroots - self.lmds[self.keyroots] + 1).sum())
+
+    def mirror(self):
+        # Postorder of the mirrored tree is the reverse of the preorder.
+        if self._mirror is None:
+            lmds = self.lmds.tolist()
+            n = len(lmds)
+            preorder = []
+            stack = [n - 1]
+            while stack:
+                v = stack.pop()
+                preorder.append(v)
+                c = v - 1
+                while c >= lmds[v]:
+                    stack.append(c)
+                    c = lmds[c] - 1
+            order = np.array(preorder[::-1], dtype=np.int32)
+            pos = np.empty(n, dtype=np.int32)
+            pos[order] = np.arange(n, dtype=np.int32)
+            sizes = order - self.lmds[order] + 1
+            self._mirror = CompactTree(self.labels[order], pos[order] - sizes + 1)
+        return self._mirror
+
+
+def _zhang_shasha(a_labels, a_lmds, a_keyroots, b_labels, b_lmds, b_keyroots, deadline=None):
+    n_a, n_b = len(a_labels), len(b_labels)
+    treedists = [[0] * n_b for _ in range(n_a)]
+
+    for i in a_keyroots:
+        li = a_lmds[i]
+        m = i - li + 2
+        for j in b_keyroots:
+            if deadline is not None and time.perf_counter() > deadline:
+                raise BudgetExceeded()
+            lj = b_lmds[j]
+            joff = lj - 1
+            n = j - lj + 2
+            # Column y of the forest table maps to node joff + y of b.
+            b_lab = [None] + b_labels[lj:j + 1]
+            b_q = [0] + [b_lmds[k] - lj for k in range(lj, j + 1)]
+            cols = range(1, n)
+
+            fd = [list(range(n))]
+            for x in range(1, m):
+                a = li - 1 + x
+                label = a_labels[a]
+                p = a_lmds[a] - li
+                prev = fd[x - 1]
+                row = [x] * n
+                td_row = treedists[a]
+                fp = fd[p]
+                left = x
+                if p == 0:
+                    for y in cols:
+                        q = b_q[y]
+                        if q == 0:
+                            v = prev[y - 1] if label == b_lab[y] else prev[y - 1] + 1
+                        else:
+                            v = fp[q] + td_row[joff + y]
+                        d = prev[y] + 1
+                        if d < v:
+                            v = d
+                        if left + 1 < v:
+                            v = left + 1
+                        if q == 0:
+                            td_row[joff + y] = v
+                        row[y] = left = v
+                else:
+                    for y in cols:
+                        v = fp[b_q[y]] + td_row[joff + y]
+                        d = prev[y] + 1
+                        if d < v:
+                            v = d
+                        if left + 1 < v:
+                            v = left + 1
+                        row[y] = left = v
+                fd.append(row)
+
+    return treedists[-1][-1]
+
+
+def _zhang_shasha_weighted(a_lmds, a_keyroots, b_lmds, b_keyroots, relabel, deadline=None):
+    # _zhang_shasha with relabel[a][b] as the cost of relabelling node a of
+    # the first tree to node b of the second (insert and delete still cost 1).
+    n_a, n_b = len(a_lmds), len(b_lmds)
+    treedists = [[0] * n_b for _ in range(n_a)]
+
+    for i in a_keyroots:
+        li = a_lmds[i]
+        m = i - li + 2
+        for j in b_keyroots:
+            if deadline is not None and time.perf_counter() > deadline:
+                raise BudgetExceeded()
+            lj = b_lmds[j]
+            joff = lj - 1
+            n = j - lj + 2
+            b_q = [0] + [b_lmds[k] - lj for k in range(lj, j + 1)]
+            cols = range(1, n)
+
+            fd = [list(range(n))]
+            for x in range(1, m):
+                a = li - 1 + x
+                p = a_lmds[a] - li
+                prev = fd[x - 1]
+                row = [x] * n
+                td_row = treedists[a]
+                fp = fd[p]
+                left = x
+                if p == 0:
+                    cost_row = relabel[a]
+                    for y in cols:
+                        q = b_q[y]
+                        if q == 0:
+                            v = prev[y - 1] + cost_row[joff + y]
+                        else:
+                            v = fp[q] + td_row[joff + y]
+                        d = prev[y] + 1
+                        if d < v:
+                            v = d
+                        if left + 1 < v:
+                            v = left + 1
+                        if q == 0:
+                            td_row[joff + y] = v
+                        row[y] = left = v
+                else:
+                    for y in cols:
+                        v = fp[b_q[y]] + td_row[joff + y]
+                        d = prev[y] + 1
+                        if d < v:
+                            v = d
+                        if left + 1 < v:
+                            v = left + 1
+                        row[y] = left = v
+                fd.append(row)
+
+    return treedists[-1][-1]
+
+
+def _height(children):
+    height = 0
+    stack = [(len(children) - 1, 0)]
+    while stack:
+        v, depth = stack.pop()
+        height = max(height, depth)
+        stack.extend((c, depth + 1) for c in children[v])
+    return height
+
+
+def distance_bounds(a, b, weighted=False):
+    # Cheap (lower, upper) bounds on tree_edit_distance(a, b), no DP.
+    # Lower: every node beyond the multiset of shared labels is deleted,
+    # inserted or relabelled, and each edit changes the height by at most 1.
+    # Upper: cost of the top-down mapping that pairs children by position.
+    # weighted=True gives bounds valid for any relabel costs in [0, 1]: the
+    # shared-label term becomes the difference in node counts.
+    n_a, n_b = len(a), len(b)
+    if n_a == 0 or n_b == 0:
+        return n_a + n_b, n_a + n_b
+
+    a_labels, b_labels = a.labels.tolist(), b.labels.tolist()
+    a_lmds, b_lmds = a.lmds.tolist(), b.lmds.tolist()
+    a_children, b_children = a.children(), b.children()
+
+    if weighted:
+        label_lower = abs(n_a - n_b)
+    else:
+        label_lower = max(n_a, n_b) - sum((Counter(a_labels) & Counter(b_labels)).values())
+    lower = max(label_lower, abs(_height(a_children) - _height(b_children)))
+
+    upper = 0
+    stack = [(n_a - 1, n_b - 1)]
+    while stack:
+        i, j = stack.pop()
+        if a_labels[i] != b_labels[j]:
+            upper += 1
+        ci, cj = a_children[i], b_children[j]
+        stack.extend(zip(ci, cj))
+        upper += sum(k - a_lmds[k] + 1 for k in ci[len(cj):])
+        upper += sum(k - b_lmds[k] + 1 for k in cj[len(ci):])
+    return lower, upper
+
+
+# Anchoring (unit costs only): two exact reductions shrink a pair before
+# the DP. Roots with equal labels map to each other, so the distance is that
+# of their child forests; and identical leading or trailing child subtrees
+# (rows) map to each other, so they can be dropped. Identical rows in the
+# middle are anchored by a common subsequence; the segment distances summed
+# are an upper bound, accepted only when it meets a lower bound: that of
+# distance_bounds, else the string edit distance of the postorder and of the
+# preorder label sequences, which unit-cost TED never goes below.
+ANCHOR_MIN_CELLS = 400
+
+
+def _sequence_distance(a, b):
+    # Levenshtein distance of two label lists, one bit per position of a
+    # (Myers' bit-parallel algorithm, in Hyyro's edit distance form).
+    if not a or not b:
+        return len(a) + len(b)
+    peq = {}
+    for i, label in enumerate(a):
+        peq[label] = peq.get(label, 0) | (1 << i)
+    mask = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    pv, mv, score = mask, 0, len(a)
+    for label in b:
+        eq = peq.get(label, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+
+def traversal_bound(a, b):
+    # Lower bound on tree_edit_distance(a, b): the string edit distance of
+    # the postorder labels, and of the preorder ones (the mirror's postorder
+    # reversed).
+    return max(
+        _sequence_distance(a.labels.tolist(), b.labels.tolist()),
+        _sequence_distance(a.mirror().labels.tolist(), b.mirror().labels.tolist()),
+    )
+
+
+def _root_children(tree):
+    lmds = tree.lmds
+    children = []
+    c = len(lmds) - 2
+    while c >= 0:
+        children.append(c)
+        c = int(lmds[c]) - 1
+    children.reverse()
+    return children
+
+
+def _subtree_key(tree, c):
+    lo = int(tree.lmds[c])
+    return tree.labels[lo:c + 1].tobytes() + (tree.lmds[lo:c + 1] - lo).tobytes()
+
+
+def _subtree(tree, c):
+    lo = int(tree.lmds[c])
+    return CompactTree(tree.labels[lo:c + 1], tree.lmds[lo:c + 1] - lo)
+
+
+def _wrap(tree, children):
+    # The root of tree over the consecutive children given.
+    if not children:
+        return CompactTree(tree.labels[-1:], [0])
+    lo, hi = int(tree.lmds[children[0]]), children[-1]
+    labels = np.append(tree.labels[lo:hi + 1], tree.labels[-1])
+    return CompactTree(labels, np.append(tree.lmds[lo:hi + 1] - lo, 0))
+
+
+def same_shape_distance(a, b):
+    # For trees of identical shape (e.g. the content trees of two tables with
+    # the same structure): the number of differing labels, when relabelling
+    # them is provably optimal, else None. It is optimal when no label
+    # removed at one node is added at another, as it then meets the
+    # label-multiset lower bound of distance_bounds.
+    if len(a) != len(b) or not np.array_equal(a.lmds, b.lmds):
+        return None
+    differ = a.labels != b.labels
+    if np.intersect1d(a.labels[differ], b.labels[differ]).size:
+        return None
+    return int(differ.sum())
+
+
+# Grid trees: a table root over tr rows of td leaves, the structure tree of
+# any OTSL table and of most HTML ones. With no empty row, an optimal mapping
+# maps the roots, rows only to rows and cells only to cells, so it is fixed
+# by the pairs of mapped rows: a mapped pair costs the difference of their
+# cell counts, and each gap between consecutive mapped pairs costs its
+# unmapped rows plus the difference of its cell totals (the cells of
+# deleted rows map to each other in order). The DP over mapped row pairs
+# needs only the cell count of each row.
+GRID_MAX_CELLS = 1 << 26
+
+
+def grid_rows(tree):
+    # Cells per row if tree is a grid tree without empty rows, else None.
+    labels, lmds = tree.labels, tree.lmds
+    if len(labels) < 2 or labels[-1] != intern_label("table") or lmds[-1] != 0:
+        return None
+    body = labels[:-1]
+    is_row = body == intern_label("tr")
+    cells = np.flatnonzero(~is_row)
+    if not is_row[-1] or (body[cells] != intern_label("td")).any() or (lmds[cells] != cells).any():
+        return None
+    ends = np.flatnonzero(is_row)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    if (lmds[ends] != starts).any() or (ends == starts).any():
+        return None
+    return ends - starts
+
+
+def grid_distance(a, b, deadline=None):
+    # Exact tree edit distance of two grid trees from their rows, or None if
+    # either is not a grid tree or the DP would exceed GRID_MAX_CELLS.
+    # Raises BudgetExceeded once time.perf_counter() passes deadline.
+    a_rows, b_rows = grid_rows(a), grid_rows(b)
+    if a_rows is None or b_rows is None:
+        return None
+    # Identical leading and trailing rows map to each other (see strip_common).
+    shortest = min(len(a_rows), len(b_rows))
+    prefix = int(np.argmin(np.append(a_rows[:shortest] == b_rows[:shortest], False)))
+    suffix = int(np.argmin(np.append(a_rows[::-1][:shortest - prefix] == b_rows[::-1][:shortest - prefix], False)))
+    a_rows, b_rows = a_rows[prefix:len(a_rows) - suffix], b_rows[prefix:len(b_rows) - suffix]
+    n, m = len(a_rows), len(b_rows)
+    width = int(a_rows.sum() + b_rows.sum()) + 1
+    if (n + 1) * (m + 2) * width > GRID_MAX_CELLS:
+        return None
+
+    # F[i, j] is the least cost of the first i / j rows with rows i and j
+    # mapped; a zero-cell sentinel row closes each side, so the distance is
+    # F[n + 1, m + 1]. Offsets are the cell differences a_sums[i] - b_sums[j]
+    # of the prefixes; a gap from the pair (i', j') to (i, j) costs
+    # (i - 1 - i') + (j - 1 - j') + |offset[i - 1, j - 1] - offset[i', j']|.
+    # envelope[j, x] holds, over the pairs (i', j') dominated by the current
+    # (i, j), the least F[i', j'] - i' - j' + |x - offset[i', j']|, so each
+    # F row is one lookup per column. Envelopes of row i are those of row
+    # i - 1 joined with the new pairs, then carried forward along j.
+    a_rows, b_rows = np.append(a_rows, 0), np.append(b_rows, 0)
+    a_sums = np.concatenate(([0], np.cumsum(a_rows))).astype(np.int32)
+    b_sums = np.concatenate(([0], np.cumsum(b_rows))).astype(np.int32)
+    xs = np.arange(width, dtype=np.int32) - b_sums[-1]
+    columns = np.arange(m + 2)
+    inf = np.int32(1 << 29)
+    envelope = np.repeat(np.abs(xs)[None, :], m + 2, axis=0)
+    for i in range(1, n + 2):
+        if deadline is not None and time.perf_counter() > deadline:
+            raise BudgetExceeded()
+        offsets = a_sums[i - 1] - b_sums[:-1]
+        rest = np.full(m + 2, inf, dtype=np.int32)
+        rest[1:] = envelope[columns[:-1], offsets + b_sums[-1]] + np.abs(a_rows[i - 1] - b_rows) - 2
+        offsets = a_sums[i] - b_sums
+        gaps = rest[:, None] + np.abs(xs[None, :] - offsets[:, None])
+        np.minimum(envelope, gaps, out=envelope)
+        for j in range(1, m + 2):
+            np.minimum(envelope[j], envelope[j - 1], out=envelope[j])
+    return int(rest[m + 1]) + n + m + 2
+
+
+def strip_common(a, b):
+    # (a', b') with tree_edit_distance(a', b') == tree_edit_distance(a, b):
+    # identical leading/trailing children of equal-labelled roots removed,
+    # descending while a single child with equal labels remains on each side.
+    while len(a) > 1 and len(b) > 1 and a.labels[-1] == b.labels[-1]:
+        a_children, b_children = _root_children(a), _root_children(b)
+        a_keys = [_subtree_key(a, c) for c in a_children]
+        b_keys = [_subtree_key(b, c) for c in b_children]
+        shortest = min(len(a_keys), len(b_keys))
+        prefix = 0
+        while prefix < shortest and a_keys[prefix] == b_keys[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < shortest - prefix and a_keys[-1 - suffix] == b_keys[-1 - suffix]:
+            suffix += 1
+        a_mid = a_children[prefix:len(a_children) - suffix]
+        b_mid = b_children[prefix:len(b_children) - suffix]
+        if len(a_mid) == 1 and len(b_mid) == 1 and a.labels[a_mid[0]] == b.labels[b_mid[0]]:
+            a, b = _subtree(a, a_mid[0]), _subtree(b, b_mid[0])
+        elif prefix or suffix:
+            return _wrap(a, a_mid), _wrap(b, b_mid)
+        else:
+            break
+    return a, b
+
+
+def _aligned_blocks(a_keys, b_keys):
+    # Runs of equal keys at equal positions, as SequenceMatcher blocks; in
+    # repetitive tables these can anchor better than the longest matches.
+    blocks = []
+    k, shortest = 0, min(len(a_keys), len(b_keys))
+    while k < shortest:
+        start = k
+        while k < shortest and a_keys[k] == b_keys[k]:
+            k += 1
+        if k > start:
+            blocks.append((start, start, k - start))
+        k += 1
+    blocks.append((len(a_keys), len(b_keys), 0))
+    return blocks
+
+
+def _segments_distance(a, b, a_children, b_children, blocks, distance):
+    # Sum of the distances between the children between anchor blocks.
+    upper = 0
+    a_start = b_start = 0
+    for a_pos, b_pos, size in blocks:
+        if a_pos > a_start or b_pos > b_start:
+            upper += anchored_edit_distance(
+                _wrap(a, a_children[a_start:a_pos]), _wrap(b, b_children[b_start:b_pos]), distance
+            )
+        a_start, b_start = a_pos + size, b_pos + size
+    return upper
+
+
+def anchored_edit_distance(a, b, distance):
+    # Exact tree edit distance (unit costs) computing distance(x, y) only on
+    # the regions that differ; distance is the exact engine to use.
+    a, b = strip_common(a, b)
+    if len(a) * len(b) <= ANCHOR_MIN_CELLS or a.labels[-1] != b.labels[-1]:
+        return distance(a, b)
+
+    a_children, b_children = _root_children(a), _root_children(b)
+    a_keys = [_subtree_key(a, c) for c in a_children]
+    b_keys = [_subtree_key(b, c) for c in b_children]
+    candidates = [SequenceMatcher(None, a_keys, b_keys, autojunk=False).get_matching_blocks()]
+    aligned = _aligned_blocks(a_keys, b_keys)
+    if aligned != [tuple(block) for block in candidates[0]]:
+        candidates.append(aligned)
+    lower = None
+    for blocks in candidates:
+        if len(blocks) == 1:
+            continue
+        upper = _segments_distance(a, b, a_children, b_children, blocks, distance)
+        if lower is None:
+            lower = distance_bounds(a, b)[0]
+            if upper > lower:
+                lower = max(lower, traversal_bound(a, b))
+        if upper == lower:
+            return upper
+    return distance(a, b)
+
+
+def _orient(a, b):
+    # The pair itself, or both mirrored if right paths make the DP cheaper.
+    if b.mirror().strategy_cost() * a.mirror().strategy_cost() < \
+            a.strategy_cost() * b.strategy_cost():
+        return a.mirror(), b.mirror()
+    return a, b
+
+
+def tree_edit_distance(a, b, deadline=None, relabel=None):
+    # Raises BudgetExceeded once time.perf_counter() passes deadline.
+    # relabel(a_labels, b_labels), if given, returns the node-by-node relabel
+    # cost matrix (see cell_distance.relabel_costs) instead of 0/1 costs.
+    if len(a) == 0 or len(b) == 0:
+        return len(a) + len(b)
+    a, b = _orient(a, b)
+    if relabel is not None:
+        return _zhang_shasha_weighted(
+            a.lmds.tolist(), a.keyroots.tolist(), b.lmds.tolist(), b.keyroots.tolist(),
+            relabel(a.labels, b.labels), deadline
+        )
+    return _zhang_shasha(
+        a.labels.tolist(), a.lmds.tolist(), a.keyroots.tolist(),
+        b.labels.tolist(), b.lmds.tolist(), b.keyroots.tolist(), deadline
+    )
+
+
+# Batched kernel: the Zhang-Shasha DPs of many pairs run together as padded
+# NumPy arrays. Keyroots are grouped by nesting level (a keyroot's subtree
+# only holds keyroots of lower levels), and every (keyroot of a, keyroot of b)
+# subproblem of one (level a, level b) pair is independent of the others, so
+# each level pair of a whole bucket of trees is one vectorized DP, one forest
+# row at a time. Each row is closed with a running minimum instead of the
+# scalar left-to-right pass.
+BUCKET_CELLS = 1 << 20
+TASK_CELLS = 1 << 22
+
+
+def _keyroot_levels(lmds, keyroots):
+    levels = np.zeros(len(keyroots), dtype=np.int32)
+    for idx in range(1, len(keyroots)):
+        inside = keyroots[:idx] >= lmds[keyroots[idx]]
+        if inside.any():
+            levels[idx] = levels[:idx][inside].max() + 1
+    return levels
+
+
+def _forest_rows(td, cost, tasks, a_lmds, b_lmds):
+    # Runs the forest-distance tables of independent keyroot pairs. tasks
+    # holds per-task arrays: off/nb (the pair's slice of td and cost and its
+    # b size), a_base/b_base (offsets into a_lmds/b_lmds) and i/li/j/lj.
+    # Padding rows and columns read real cells (indices are clamped) but
+    # never write to td.
+    off, nb, a_base, b_base, i, li, j, lj = tasks
+    m, n = i - li + 2, j - lj + 2
+    rows, cols, count = int(m.max()), int(n.max()), len(i)
+    y = np.arange(cols, dtype=td.dtype)
+
+    k = lj[:, None] - 1 + np.arange(cols)
+    valid_col = (k >= lj[:, None]) & (k <= j[:, None])
+    k = np.where(valid_col, k, lj[:, None])
+    q = np.where(valid_col, b_lmds[b_base[:, None] + k] - lj[:, None], 0)
+    # Cells whose column is on the leftmost path of j (q == 0) are the only
+    # ones that can take the relabel (diagonal) step and write to td.
+    diag_t, diag_y = np.nonzero(q[:, 1:] == 0)
+    diag_y += 1
+    diag_valid = valid_col[diag_t, diag_y]
+    k_idx = off[:, None] + k
+    # fd[x] is forest row x of every task; fd_q + p * count * cols is the
+    # flat index of fd[p, task, q].
+    fd = np.empty((rows, count, cols), dtype=td.dtype)
+    fd[0] = y
+    fd_flat = fd.reshape(-1)
+    fd_q = np.arange(count)[:, None] * cols + q
+
+    for x in range(1, rows):
+        a = np.minimum(li - 1 + x, i)
+        p = a_lmds[a_base + a] - li
+        idx = k_idx + (a * nb)[:, None]
+
+        prev = fd[x - 1]
+        c = np.take(fd_flat, fd_q + (p * (count * cols))[:, None]) + np.take(td, idx)
+        on_path = (p == 0)[diag_t]
+        t, col = diag_t[on_path], diag_y[on_path]
+        diag_idx = idx[t, col]
+        c[t, col] = prev[t, col - 1] + np.take(cost, diag_idx)
+        np.minimum(c, prev + 1, out=c)
+        c[:, 0] = x
+        c -= y
+        row = fd[x]
+        np.minimum.accumulate(c, axis=1, out=row)
+        row += y
+
+        write = diag_valid[on_path] & (x < m)[t]
+        td[diag_idx[write]] = row[t[write], col[write]]
+
+
+def _batch_distances(pairs, relabels):
+    weighted = relabels is not None
+    dtype = np.float64 if weighted else np.int32
+    sizes = np.array([len(a) * len(b) for a, b in pairs], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    td = np.zeros(offsets[-1], dtype=dtype)
+    cost = np.zeros(offsets[-1], dtype=dtype)
+    for p, (a, b) in enumerate(pairs):
+        if weighted:
+            costs = np.asarray(relabels[p], dtype=dtype)
+        else:
+            costs = a.labels[:, None] != b.labels[None, :]
+        cost[offsets[p]:offsets[p + 1]] = costs.ravel()
+
+    a_lmds = np.concatenate([a.lmds for a, _ in pairs]).astype(np.int64)
+    b_lmds = np.concatenate([b.lmds for _, b in pairs]).astype(np.int64)
+    a_bases = np.concatenate([[0], np.cumsum([len(a) for a, _ in pairs])])
+    b_bases = np.concatenate([[0], np.cumsum([len(b) for _, b in pairs])])
+    a_levels = [_keyroot_levels(a.lmds, a.keyroots) for a, _ in pairs]
+    b_levels = [_keyroot_levels(b.lmds, b.keyroots) for _, b in pairs]
+
+    # Lower levels first on both sides satisfies every dependency.
+    for level_a in range(max(int(levels.max()) for levels in a_levels) + 1):
+        for level_b in range(max(int(levels.max()) for levels in b_levels) + 1):
+            parts = []
+            for p, (a, b) in enumerate(pairs):
+                ia = a.keyroots[a_levels[p] == level_a].astype(np.int64)
+                jb = b.keyroots[b_levels[p] == level_b].astype(np.int64)
+                if not len(ia) or not len(jb):
+                    continue
+                i, j = np.repeat(ia, len(jb)), np.tile(jb, len(ia))
+                count = len(i)
+                parts.append((
+                    np.full(count, offsets[p]), np.full(count, len(b)),
+                    np.full(count, a_bases[p]), np.full(count, b_bases[p]),
+                    i, a.lmds[i].astype(np.int64), j, b.lmds[j].astype(np.int64)
+                ))
+            if not parts:
+                continue
+            tasks = [np.concatenate(column) for column in zip(*parts)]
+
+            # Tasks are chunked by (rows, columns) rounded up to powers of
+            # sqrt(2), which bounds the padding, and by TASK_CELLS.
+            _, _, _, _, i, li, j, lj = tasks
+            m, n = i - li + 2, j - lj + 2
+            key = np.ceil(2 * np.log2(m)) * 64 + np.ceil(2 * np.log2(n))
+            order = np.argsort(key, kind="stable")
+            tasks = [column[order] for column in tasks]
+            key, m, n = key[order], m[order], n[order]
+            bounds = np.flatnonzero(np.diff(key)) + 1
+            for start, end in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(key)]])):
+                if m[start] == 2 and n[start] == 2:
+                    # Two single nodes: the distance is their relabel cost.
+                    off, nb, _, _, i, _, j, _ = [column[start:end] for column in tasks]
+                    flat = off + i * nb + j
+                    td[flat] = cost[flat]
+                    continue
+                step = max(1, TASK_CELLS // int(m[start:end].max() * n[start:end].max()))
+                for chunk in range(start, end, step):
+                    _forest_rows(td, cost, [column[chunk:min(chunk + step, end)] for column in tasks], a_lmds, b_lmds)
+
+    results = td[offsets[1:] - 1]
+    return results.tolist()
+
+
+def batch_tree_edit_distance(pairs, relabel=None):
+    # tree_edit_distance for a list of (a, b) pairs, computed by the batched
+    # kernel in buckets of similar size. Empty trees are handled directly.
+    pairs = list(pairs)
+    results = [None] * len(pairs)
+    todo = []
+    for p, (a, b) in enumerate(pairs):
+        if len(a) == 0 or len(b) == 0:
+            results[p] = len(a) + len(b)
+        else:
+            pairs[p] = _orient(a, b)
+            todo.append(p)
+    todo.sort(key=lambda p: len(pairs[p][0]) * len(pairs[p][1]))
+
+    start = 0
+    while start < len(todo):
+        end, cells = start, 0
+        while end < len(todo) and (end == start or cells + len(pairs[todo[end]][0]) * len(pairs[todo[end]][1]) <= BUCKET_CELLS):
+            cells += len(pairs[todo[end]][0]) * len(pairs[todo[end]][1])
+            end += 1
+        bucket = [pairs[p] for p in todo[start:end]]
+        relabels = None if relabel is None else [relabel(a.labels, b.labels) for a, b in bucket]
+        for p, distance in zip(todo[start:end], _batch_distances(bucket, relabels)):
+            results[p] = distance
+        start = end
+    return results
@@ -1,4 +1,9 @@
+import re
+import time
+
 from bs4 import BeautifulSoup
+from lxml import etree
+from tree_distance import CompactTree, intern_label
 
 def remove_all_attributes(html_string):
     soup = BeautifulSoup(html_string, "html.parser")
@@ -21,3 +26,85 @@ def clean_html(html_):
 
 def preprocess(html):
     return clean_html(remove_all_attributes(html))
+
+# Tags dropped by clean_html; their children and text are kept.
+IGNORED_TAGS = {"thead", "tbody", "sup", "sub", "p"}
+_WHITESPACE = re.compile(r"\s+")
+# clean_html also deletes colspan="N" / rowspan="N" (N <= 30) from cell text.
+_SPAN_TEXT = re.compile(r'(?:col|row)span="(?:[12]?\d|30)"')
+
+def html_to_tree(html, structure_only=True, clean=False, strip_attributes=False, timings=None):
+    # One lxml pass from HTML to a CompactTree of the first <table>.
+    # clean=True without strip_attributes (GT tables) applies clean_html to
+    # the string first, as the legacy path did: its edits are plain string
+    # replacements ("<sub class=q>" stays while its "</sub>" goes, "<thx>"
+    # becomes "<tdx>", "<tbody>" inside a cell is dropped before lxml can
+    # move it), and only running it reproduces them; it is also faster than
+    # unwrapping the parsed tags.
+    # With strip_attributes=True as well (predictions) it matches
+    # preprocess() while walking the parse events instead of running
+    # BeautifulSoup: ignored tags unwrapped, th -> td, entity whitespace
+    # collapsed, span text deleted. It only differs on malformed HTML, which
+    # html.parser and lxml repair differently, and on unknown tags starting
+    # with "th", which are not renamed.
+    # Attributes never reach the tree, so they are simply not read.
+    # timings, if given, accumulates seconds spent in "parse" (lxml) and
+    # "normalize" (everything else).
+    start = time.perf_counter()
+    if clean and not strip_attributes:
+        html = clean_html(html)
+        clean = False
+    elif clean:
+        html = _SPAN_TEXT.sub("", html)
+    collapse = clean and strip_attributes
+
+    parse_start = time.perf_counter()
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    parser.feed(html)
+    parser.close()
+    parse_end = time.perf_counter()
+
+    labels, content_labels, lmds = [], [], []
+    stack = []
+    for event, element in parser.read_events():
+        tag = element.tag
+        if not stack:
+            if labels:
+                break
+            if event != "start" or tag != "table":
+                continue
+
+        if event == "start":
+            skip = clean and tag in IGNORED_TAGS
+            stack.append((skip, len(labels)))
+            continue
+
+        skip, start_index = stack.pop()
+        if skip:
+            continue
+        if clean and tag == "th":
+            tag = "td"
+        label = intern_label(tag)
+        labels.append(label)
+        lmds.append(start_index)
+        if not structure_only:
+            if tag == "td":
+                if collapse:
+                    text = "".join(_WHITESPACE.sub(" ", s) for s in element.itertext())
+                else:
+                    text = "".join(element.itertext())
+                label = intern_label(tag + ":" + text.strip())
+            content_labels.append(label)
+
+    if not labels:
+        tree = None
+    elif structure_only:
+        tree = CompactTree(labels, lmds)
+    else:
+        tree = CompactTree(labels, lmds, content_labels)
+
+    if timings is not None:
+        end = time.perf_counter()
+        timings["parse"] = timings.get("parse", 0.0) + parse_end - parse_start
+        timings["normalize"] = timings.get("normalize", 0.0) + (parse_start - start) + (end - parse_end)
+    return tree
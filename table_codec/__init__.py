@@ -0,0 +1,8 @@
+# Conversions between OTSL, HTML, Markdown and plain-text tables through an
+# array-backed cell grid (TableGrid). OTSL <-> grid <-> HTML is lossless up
+# to whitespace; Markdown and plain text cannot express spans.
+from .convert import CACHE_SIZE, FORMATS, convert, parse, render, table_text
+from .grid import TableGrid
+from .html import parse_html, to_html
+from .otsl import parse_otsl, to_otsl
+from .text import parse_markdown, parse_plain_text, to_markdown, to_plain_text
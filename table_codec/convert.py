@@ -0,0 +1,44 @@
+from functools import lru_cache
+
+from .html import parse_html, to_html
+from .otsl import parse_otsl, to_otsl
+from .text import parse_markdown, parse_plain_text, to_markdown, to_plain_text
+
+# Formats by the dataset field that holds them.
+PARSERS = {"otsl": parse_otsl, "html": parse_html, "markdown": parse_markdown, "plain_text": parse_plain_text}
+RENDERERS = {"otsl": to_otsl, "html": to_html, "markdown": to_markdown, "plain_text": to_plain_text}
+FORMATS = tuple(PARSERS)
+# OTSL and HTML keep spans, so they are the preferred sources.
+SOURCE_ORDER = ("otsl", "html", "markdown", "plain_text")
+CACHE_SIZE = 4096
+
+
+def parse(table, fmt):
+    return PARSERS[fmt](table)
+
+
+def render(grid, fmt):
+    return RENDERERS[fmt](grid)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def convert(table, source, target):
+    # table, a string in the source format, in the target format. Results
+    # are kept in an LRU cache, so each table is converted once per process
+    # however many epochs or scoring passes read it.
+    if source == target:
+        return table
+    return render(parse(table, source), target)
+
+
+def table_text(entry, fmt, fields=None):
+    # The table of a dataset entry in format fmt: the entry's own field if it
+    # has one, else converted from the first format it does hold. fields maps
+    # a format to the entry key holding it, where that is not the format name.
+    fields = fields or {}
+    if entry.get(fields.get(fmt, fmt)) is not None:
+        return entry[fields.get(fmt, fmt)]
+    for source in SOURCE_ORDER:
+        if entry.get(fields.get(source, source)):
+            return convert(entry[fields.get(source, source)], source, fmt)
+    raise KeyError(f"Entry has no table in any of {SOURCE_ORDER}")
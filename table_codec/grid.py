@@ -0,0 +1,90 @@
+import numpy as np
+
+# A table as a rectangular array of OTSL cell kinds plus the text of each
+# cell that starts a span (an "origin"). Spans are implied by the merge
+# kinds, as in OTSL: LCEL continues the cell to the left, UCEL the cell
+# above, XCEL both. Rows shorter than the widest one (malformed OTSL) are
+# padded with PAD, which no format writes out.
+PAD, FCEL, ECEL, LCEL, UCEL, XCEL, CHED, RHED, SROW = range(9)
+KIND_NAMES = ["pad", "fcel", "ecel", "lcel", "ucel", "xcel", "ched", "rhed", "srow"]
+# Kinds that start a cell: content, empty, column header, row header and
+# section row cells.
+ORIGIN_KINDS = (FCEL, ECEL, CHED, RHED, SROW)
+
+
+def _runs(mask):
+    # runs[r, c] = number of consecutive True cells in mask from (r, c) rightwards.
+    width = mask.shape[1]
+    columns = np.arange(width)
+    stops = np.where(mask, width, columns)
+    stops = np.minimum.accumulate(stops[:, ::-1], axis=1)[:, ::-1]
+    return stops - columns
+
+
+class TableGrid:
+    __slots__ = ("kinds", "texts")
+
+    def __init__(self, kinds, texts):
+        # kinds: (rows, cols) array of the constants above; texts: one string
+        # per origin cell, in row-major order ("" for ECEL).
+        self.kinds = np.asarray(kinds, dtype=np.int8)
+        self.texts = list(texts)
+
+    @classmethod
+    def from_rows(cls, rows):
+        # rows: lists of (kind, text) as read from OTSL, possibly ragged.
+        width = max((len(row) for row in rows), default=0)
+        kinds = np.full((len(rows), width), PAD, dtype=np.int8)
+        texts = []
+        for r, row in enumerate(rows):
+            kinds[r, :len(row)] = [kind for kind, _ in row]
+            texts.extend(text if kind != ECEL else "" for kind, text in row if kind in ORIGIN_KINDS)
+        return cls(kinds, texts)
+
+    @classmethod
+    def from_cells(cls, n_rows, n_cols, cells):
+        # cells: (row, col, rowspan, colspan, kind, text) for every origin, in
+        # row-major order; covered positions get the matching merge kinds.
+        kinds = np.full((n_rows, n_cols), PAD, dtype=np.int8)
+        for row, col, rowspan, colspan, _, _ in cells:
+            if rowspan > 1 or colspan > 1:
+                kinds[row:row + rowspan, col:col + colspan] = XCEL
+                kinds[row, col + 1:col + colspan] = LCEL
+                kinds[row + 1:row + rowspan, col] = UCEL
+        if cells:
+            rows, cols, _, _, origin_kinds, texts = zip(*cells)
+            kinds[list(rows), list(cols)] = origin_kinds
+        return cls(kinds, texts if cells else [])
+
+    @property
+    def shape(self):
+        return self.kinds.shape
+
+    def __eq__(self, other):
+        return (isinstance(other, TableGrid) and self.kinds.shape == other.kinds.shape
+                and np.array_equal(self.kinds, other.kinds) and self.texts == other.texts)
+
+    def origins(self):
+        # (rows, cols) of the origin cells, row-major.
+        return np.nonzero(np.isin(self.kinds, ORIGIN_KINDS))
+
+    def spans(self):
+        # (rowspans, colspans) of the origin cells, in the order of origins().
+        rows, cols = self.origins()
+        kinds = np.pad(self.kinds, ((0, 1), (0, 1)), constant_values=PAD)
+        colspans = 1 + _runs((kinds == LCEL) | (kinds == XCEL))[rows, cols + 1]
+        rowspans = 1 + _runs(((kinds == UCEL) | (kinds == XCEL)).T)[cols, rows + 1]
+        return rowspans, colspans
+
+    def cells(self):
+        # (row, col, rowspan, colspan, kind, text) for every origin cell.
+        rows, cols = self.origins()
+        rowspans, colspans = self.spans()
+        kinds = self.kinds[rows, cols]
+        return list(zip(
+            rows.tolist(), cols.tolist(), rowspans.tolist(), colspans.tolist(), kinds.tolist(), self.texts
+        ))
+
+    def row_sizes(self):
+        # Origin cells per row.
+        return np.isin(self.kinds, ORIGIN_KINDS).sum(axis=1)
@@ -0,0 +1,120 @@
+from html import escape
+from html.parser import HTMLParser
+
+from .grid import CHED, ECEL, FCEL, TableGrid
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# HTML tables, parsed with lxml when it is installed (about 10x faster) and
+# with the standard library otherwise, so the codec needs nothing beyond
+# NumPy. Column headers (CHED) are written as <th> and <th> is read back as
+# CHED; row header and section row cells become plain <td>.
+
+
+class _TableParser(HTMLParser):
+    # Collects the cells of the first <table>: (row, header, rowspan, colspan, text).
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.depth = 0
+        self.done = False
+        self.rows = 0
+        self.cells = []
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "table":
+            self.depth += 1
+        elif self.depth == 1 and tag == "tr":
+            self.rows += 1
+        elif self.depth == 1 and tag in ("td", "th") and self.rows:
+            attrs = dict(attrs)
+            self.cell = [self.rows - 1, tag == "th", _span(attrs.get("rowspan")), _span(attrs.get("colspan")), []]
+            self.cells.append(self.cell)
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if tag == "table":
+            self.depth -= 1
+            self.done = self.depth == 0
+        elif self.depth == 1 and tag in ("td", "th", "tr"):
+            self.cell = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell[4].append(data)
+
+
+def _lxml_cells(html):
+    # As _TableParser, with lxml: (n_rows, cells) of the first <table>.
+    root = etree.fromstring(html, etree.HTMLParser()) if html.strip() else None
+    table = None if root is None else root.find(".//table")
+    if table is None:
+        return 0, []
+    rows = []
+    for child in table:
+        if child.tag == "tr":
+            rows.append(child)
+        elif child.tag in ("thead", "tbody", "tfoot"):
+            rows.extend(tr for tr in child if tr.tag == "tr")
+    cells = [
+        (r, td.tag == "th", _span(td.get("rowspan")), _span(td.get("colspan")), td.itertext())
+        for r, tr in enumerate(rows) for td in tr if td.tag in ("td", "th")
+    ]
+    return len(rows), cells
+
+
+def _span(value):
+    if not value:
+        return 1
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+
+def parse_html(html):
+    # TableGrid of the first <table> in html. Spans are placed as browsers
+    # place them: each cell takes the next free column of its row, and spans
+    # past the last row are cut.
+    if etree is not None:
+        n_rows, parsed = _lxml_cells(html)
+    else:
+        parser = _TableParser()
+        parser.feed(html)
+        parser.close()
+        n_rows, parsed = parser.rows, parser.cells
+    # Columns of each row taken by rowspans from the rows above.
+    taken = [set() for _ in range(n_rows)]
+    cells = []
+    n_cols = 0
+    current = col = -1
+    for row, header, rowspan, colspan, text in parsed:
+        if row != current:
+            current, col = row, 0
+        while col in taken[row]:
+            col += 1
+        rowspan = min(rowspan, n_rows - row)
+        for r in range(row + 1, row + rowspan):
+            taken[r].update(range(col, col + colspan))
+        text = " ".join("".join(text).split())
+        kind = CHED if header else (FCEL if text else ECEL)
+        cells.append((row, col, rowspan, colspan, kind, text))
+        col += colspan
+        n_cols = max(n_cols, col)
+    cells.sort()
+    return TableGrid.from_cells(n_rows, n_cols, cells)
+
+
+def to_html(grid):
+    rows = [[] for _ in range(grid.shape[0])]
+    for row, _, rowspan, colspan, kind, text in grid.cells():
+        tag = "th" if kind == CHED else "td"
+        attrs = (f' colspan="{colspan}"' if colspan > 1 else "") + (f' rowspan="{rowspan}"' if rowspan > 1 else "")
+        rows[row].append(f"<{tag}{attrs}>{escape(text, quote=False)}</{tag}>")
+    return "<table>" + "".join(f"<tr>{''.join(cells)}</tr>" for cells in rows) + "</table>"
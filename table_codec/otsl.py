@@ -0,0 +1,51 @@
+import re
+
+import numpy as np
+
+from .grid import ECEL, KIND_NAMES, ORIGIN_KINDS, PAD, TableGrid
+
+# OTSL: one token per grid position, rows closed by <nl>, the text of a cell
+# following its token, e.g. "<fcel>Year<fcel>Total<lcel><nl>".
+_TOKEN = re.compile(r"<(fcel|ecel|lcel|ucel|xcel|nl|ched|rhed|srow)>")
+NL = -1
+_KINDS = {name: kind for kind, name in enumerate(KIND_NAMES)}
+_KINDS["nl"] = NL
+_ORIGIN_TOKENS = {KIND_NAMES[kind] for kind in ORIGIN_KINDS}
+
+
+def parse_otsl(otsl):
+    # TableGrid of an OTSL string. Text before the first token, and after a
+    # merge token or <ecel>, is ignored; a last row without <nl> is kept.
+    parts = _TOKEN.split(otsl)
+    tokens, texts = parts[1::2], parts[2::2]
+    codes = np.array([_KINDS[token] for token in tokens], dtype=np.int8)
+    ends = np.flatnonzero(codes == NL)
+    if tokens and tokens[-1] != "nl":
+        ends = np.append(ends, len(tokens))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    cell = codes != NL
+    rows = np.cumsum(~cell) - ~cell
+    cols = np.flatnonzero(cell) - starts[rows[cell]]
+    kinds = np.full((len(ends), int((ends - starts).max(initial=0))), PAD, dtype=np.int8)
+    kinds[rows[cell], cols] = codes[cell]
+    origin_texts = [
+        "" if token == "ecel" else " ".join(text.split())
+        for token, text in zip(tokens, texts) if token in _ORIGIN_TOKENS
+    ]
+    return TableGrid(kinds, origin_texts)
+
+
+def to_otsl(grid):
+    texts = iter(grid.texts)
+    out = []
+    for row in grid.kinds.tolist():
+        for kind in row:
+            if kind == PAD:
+                continue
+            out.append(f"<{KIND_NAMES[kind]}>")
+            if kind in ORIGIN_KINDS:
+                text = next(texts)
+                if kind != ECEL:
+                    out.append(text)
+        out.append("<nl>")
+    return "".join(out)
@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+import table_codec.html
+from table_codec import (
+    TableGrid, convert, parse_html, parse_markdown, parse_otsl, parse_plain_text, to_html, to_markdown, to_otsl,
+    to_plain_text
+)
+from table_codec.grid import CHED, ECEL, FCEL, RHED, SROW
+
+# OTSL and HTML must round-trip any grid, spans included (HTML only knows
+# th and td cells); Markdown and plain text must keep every cell's text at
+# its origin and drop the spans.
+TEXTS = ("a", "Total 2019", "1,234.5", "a < b & c", "café", "x|y")
+
+
+def random_grid(rng, rows, cols, kinds=(FCEL, FCEL, ECEL, CHED), texts=TEXTS):
+    # Origins of the given kinds; about a third of them span several rows
+    # and/or columns.
+    covered = [[False] * cols for _ in range(rows)]
+    cells = []
+    for r in range(rows):
+        for c in range(cols):
+            if covered[r][c]:
+                continue
+            width = height = 1
+            if rng.random() < 0.3:
+                while c + width < cols and not covered[r][c + width] and rng.random() < 0.6:
+                    width += 1
+                while r + height < rows and not any(covered[r + height][c:c + width]) and rng.random() < 0.6:
+                    height += 1
+            for i in range(r, r + height):
+                covered[i][c:c + width] = [True] * width
+            kind = rng.choice(kinds)
+            cells.append((r, c, height, width, kind, "" if kind == ECEL else rng.choice(texts)))
+    return TableGrid.from_cells(rows, cols, cells)
+
+
+def grids(seed, count=300, **kwargs):
+    rng = random.Random(seed)
+    return [random_grid(rng, rng.randint(1, 6), rng.randint(1, 6), **kwargs) for _ in range(count)]
+
+
+@pytest.mark.parametrize("lxml", [True, False])
+def test_html_round_trip(monkeypatch, lxml):
+    if not lxml:
+        monkeypatch.setattr(table_codec.html, "etree", None)
+    elif table_codec.html.etree is None:
+        pytest.skip("lxml is not installed")
+    for grid in grids(0):
+        html = to_html(grid)
+        assert parse_html(html) == grid
+        assert to_html(parse_html(html)) == html
+
+
+def test_html_sections_and_headers():
+    html = (
+        "<table><thead><tr><th rowspan=\"2\">Year</th><th colspan=\"2\">Sales</th></tr>"
+        "<tr><th>Q1</th><th></th></tr></thead>"
+        "<tbody><tr><td>2019</td><td> 1.5 </td><td></td></tr>"
+        "<tr><td colspan=\"3\" rowspan=\"4\">note</td></tr></tbody></table>"
+    )
+    grid = parse_html(html)
+    assert to_otsl(grid) == (
+        "<ched>Year<ched>Sales<lcel><nl><ucel><ched>Q1<ched><nl>"
+        "<fcel>2019<fcel>1.5<ecel><nl><fcel>note<lcel><lcel><nl>"
+    )
+    assert parse_html(to_html(grid)) == grid
+
+
+def test_otsl_round_trip():
+    for grid in grids(1, kinds=(FCEL, ECEL, CHED, RHED, SROW)):
+        otsl = to_otsl(grid)
+        assert parse_otsl(otsl) == grid
+        assert to_otsl(parse_otsl(otsl)) == otsl
+
+
+def test_html_otsl():
+    for grid in grids(2):
+        otsl, html = to_otsl(grid), to_html(grid)
+        assert convert(otsl, "otsl", "html") == html
+        assert convert(html, "html", "otsl") == otsl
+        assert convert(convert(otsl, "otsl", "html"), "html", "otsl") == otsl
+    # Row headers and section rows are plain cells in HTML.
+    assert convert("<rhed>a<srow>b<ecel><nl>", "otsl", "html") == "<table><tr><td>a</td><td>b</td><td></td></tr></table>"
+
+
+def span_free(grid):
+    # The grid Markdown / plain text read back: every position a cell, the
+    # text at each origin, "" where a span covered the position.
+    rows = [[""] * grid.shape[1] for _ in range(grid.shape[0])]
+    for row, col, _, _, _, text in grid.cells():
+        rows[row][col] = text
+    kinds = [[FCEL if text else ECEL for text in row] for row in rows]
+    return TableGrid(kinds, [text for row in rows for text in row])
+
+
+def test_markdown():
+    grid = parse_otsl("<fcel>Year<fcel>Sales<lcel><nl><fcel>2019<fcel>1|2<ucel><nl><ucel><ecel><fcel>3<nl>")
+    assert to_markdown(grid) == "| Year | Sales |  |\n| --- | --- | --- |\n| 2019 | 1\\|2 |  |\n|  |  | 3 |"
+    for grid in grids(3):
+        assert parse_markdown(to_markdown(grid)) == span_free(grid)
+
+
+def test_plain_text():
+    grid = parse_otsl("<fcel>Year<fcel>Sales<lcel><nl><ucel><ecel><fcel>3<nl>")
+    assert to_plain_text(grid) == "Year | Sales | \n |  | 3"
+    texts = [text for text in TEXTS if "|" not in text]
+    for grid in grids(4, texts=texts):
+        if grid.shape == (1, 1) and grid.texts == [""]:
+            # A single empty cell is written as "", read back as no table.
+            assert parse_plain_text(to_plain_text(grid)).shape == (0, 0)
+            continue
+        assert parse_plain_text(to_plain_text(grid)) == span_free(grid)
@@ -0,0 +1,61 @@
+import re
+
+import numpy as np
+
+from .grid import ECEL, FCEL, TableGrid
+
+# Markdown pipe tables and plain text, one line per row. Neither can express
+# spans: a spanning cell's text is written at its origin and the positions
+# it covers are left empty, so reading them back gives a span-free grid.
+_PIPE = re.compile(r"(?<!\\)\|")
+_SEPARATOR = re.compile(r"^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?$")
+PLAIN_SEPARATOR = " | "
+
+
+def _text_rows(grid):
+    # Rows of cell strings, "" where a span covers the position.
+    rows = [[""] * grid.shape[1] for _ in range(grid.shape[0])]
+    for row, col, _, _, _, text in grid.cells():
+        rows[row][col] = text
+    return rows
+
+
+def _grid(rows):
+    width = max((len(row) for row in rows), default=0)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    texts = [text for row in rows for text in row]
+    kinds = np.array([FCEL if text else ECEL for text in texts], dtype=np.int8).reshape(len(rows), width)
+    return TableGrid(kinds, texts)
+
+
+def to_markdown(grid):
+    rows = [[text.replace("|", "\\|") for text in row] for row in _text_rows(grid)]
+    if not rows:
+        return ""
+    lines = ["| " + " | ".join(row) + " |" for row in rows]
+    lines.insert(1, "|" + "|".join(" --- " for _ in rows[0]) + "|")
+    return "\n".join(lines)
+
+
+def parse_markdown(markdown):
+    rows = []
+    for line in markdown.strip().splitlines():
+        line = line.strip()
+        if not line or _SEPARATOR.match(line):
+            continue
+        if line.startswith("|"):
+            line = line[1:]
+        if line.endswith("|") and not line.endswith("\\|"):
+            line = line[:-1]
+        rows.append([" ".join(cell.split()).replace("\\|", "|") for cell in _PIPE.split(line)])
+    return _grid(rows)
+
+
+def to_plain_text(grid):
+    return "\n".join(PLAIN_SEPARATOR.join(row) for row in _text_rows(grid))
+
+
+def parse_plain_text(text):
+    # Every line is a row, so rows of empty cells survive a round trip.
+    lines = text.split("\n") if text else []
+    return _grid([[" ".join(cell.split()) for cell in line.split(PLAIN_SEPARATOR.strip())] for line in lines])